@@ -0,0 +1,84 @@
+"""Neighborhood graph construction: topopy's default (nglpy) against KnnGraph.
+
+usage: python benchmarks/graph.py [--sizes 2000 10000 50000] [--dims 2 5 10] [--knn 32] [--beta 1] [--msc]
+
+'edges' is the number of (undirected) edges and 'diff' the fraction of them that differs from nglpy's beta skeleton.
+With --msc the whole msc() is timed as well.
+"""
+import argparse
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from regulus.core.data import Data
+from regulus.topo import msc
+from regulus.topo.graph import KnnGraph, ngl_graph, adjacency_of
+
+BACKENDS = {
+    'ngl relaxed': lambda knn, beta: ngl_graph('relaxed beta skeleton', knn, beta),
+    'ngl': lambda knn, beta: ngl_graph('beta skeleton', knn, beta),
+    'kdtree': lambda knn, beta: KnnGraph(knn, beta, backend='kdtree'),
+    'sklearn': lambda knn, beta: KnnGraph(knn, beta, backend='sklearn'),
+    'kdtree knn': lambda knn, beta: KnnGraph(knn, None, backend='kdtree'),
+}
+
+
+def points(n, dims, rng):
+    x = rng.uniform(-1, 1, size=(n, dims))
+    y = np.exp(-np.sum(x * x, axis=1)) + np.sin(3 * x[:, 0])
+    return x, y
+
+
+def adjacency(graph, x):
+    return graph.adjacency if getattr(graph, 'adjacency', None) is not None else adjacency_of(graph, len(x))
+
+
+def run(n, dims, knn, beta, backends, with_msc, rng):
+    x, y = points(n, dims, rng)
+    report = []
+    reference = None
+    for name in backends:
+        graph = BACKENDS[name](knn, beta)
+        start = perf_counter()
+        graph.build(x)
+        elapsed = perf_counter() - start
+        a = adjacency(graph, x) > 0
+        if name == 'ngl':
+            reference = a
+        row = dict(n=n, dims=dims, backend=name, graph=elapsed, edges=a.nnz // 2)
+        if reference is not None and name != 'ngl':
+            row['diff'] = (a != reference).nnz / max(1, reference.nnz)
+        if with_msc:
+            data = Data(pd.DataFrame(x), pd.DataFrame(dict(y=y)))
+            start = perf_counter()
+            msc(data, knn=knn, beta=beta, graph=BACKENDS[name](knn, beta))
+            row['msc'] = perf_counter() - start
+        report.append(row)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='neighborhood graph construction')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[2000, 10000, 50000])
+    parser.add_argument('--dims', type=int, nargs='+', default=[2, 5, 10])
+    parser.add_argument('--knn', type=int, default=32)
+    parser.add_argument('--beta', type=float, default=1)
+    parser.add_argument('--backends', nargs='+', default=['ngl', 'ngl relaxed', 'kdtree', 'sklearn', 'kdtree knn'],
+                        choices=list(BACKENDS))
+    parser.add_argument('--msc', action='store_true', help='time the whole msc() as well')
+    parser.add_argument('--seed', type=int, default=0)
+    ns = parser.parse_args()
+
+    rng = np.random.default_rng(ns.seed)
+    print(f'{"n":>8} {"dims":>5} {"backend":>12} {"graph":>9} {"edges":>9} {"diff":>9} {"msc":>9}')
+    for dims in ns.dims:
+        for n in ns.sizes:
+            for r in run(n, dims, ns.knn, ns.beta, ns.backends, ns.msc, rng):
+                fmt = lambda key, f='.3f': format(r[key], f) if key in r else '-'
+                print(f'{n:>8} {dims:>5} {r["backend"]:>12} {fmt("graph"):>9} {r["edges"]:>9} '
+                      f'{fmt("diff", ".1e"):>9} {fmt("msc"):>9}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Scaling of inverse_lowess_std on a single partition.
+
+usage: python benchmarks/inverse_std.py [--sizes 10000 20000 50000 100000] [--dims 4] [--methods exact binned]
+
+'window' only pays off for kernels that are narrow relative to the range of y (see --bandwidth).
+"""
+import argparse
+from time import perf_counter
+
+import numpy as np
+
+from regulus.models.inv_reg import gaussian, inverse_lowess_std, TOL, BINS
+
+
+def partition(n, dims, rng):
+    x = rng.uniform(-1, 1, size=(n, dims))
+    y = np.exp(-np.sum(x * x, axis=1)) + 0.05 * rng.normal(size=n)
+    return x, y
+
+
+def run(n, dims, methods, bandwidth, exact_max, tol, bins, rng):
+    x, y = partition(n, dims, rng)
+    kernel = gaussian(bandwidth * (y.max() - y.min()))
+    S = np.linspace(y.min(), y.max(), 40)
+
+    report = dict(n=n)
+    exact = None
+    for method in methods:
+        if method == 'exact' and n > exact_max:
+            continue
+        start = perf_counter()
+        std = inverse_lowess_std(x, y, S, kernel=kernel, method=method, tol=tol, bins=bins)
+        report[method] = perf_counter() - start
+        if method == 'exact':
+            exact = std
+        elif exact is not None:
+            report[method + '_err'] = np.abs(std - exact).max() / np.abs(exact).max()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='inverse_lowess_std scaling')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 20000, 50000, 100000])
+    parser.add_argument('--dims', type=int, default=4)
+    parser.add_argument('--methods', nargs='+', default=['exact', 'window', 'binned'],
+                        choices=['exact', 'window', 'binned'])
+    parser.add_argument('--bandwidth', type=float, default=0.2, help='kernel sigma relative to the range of y')
+    parser.add_argument('--exact-max', type=int, default=20000, help='skip the exact method above this size')
+    parser.add_argument('--tol', type=float, default=TOL)
+    parser.add_argument('--bins', type=int, default=BINS)
+    parser.add_argument('--seed', type=int, default=0)
+    ns = parser.parse_args()
+
+    rng = np.random.default_rng(ns.seed)
+    print(f'{"n":>8} {"exact":>9} {"window":>9} {"err":>9} {"binned":>9} {"err":>9}')
+    for n in ns.sizes:
+        r = run(n, ns.dims, ns.methods, ns.bandwidth, ns.exact_max, ns.tol, ns.bins, rng)
+        fmt = lambda key, f='.3f': format(r[key], f) if key in r else '-'
+        print(f'{n:>8} {fmt("exact"):>9} {fmt("window"):>9} {fmt("window_err", ".1e"):>9} '
+              f'{fmt("binned"):>9} {fmt("binned_err", ".1e"):>9}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""Time each stage of building a regulus, on synthetic Gaussian mixtures (like gauss4) of increasing size.
+
+usage: python benchmarks/stages.py run [--sizes 2000 10000 50000] [--dims 2 4] [--knn 16] [--out results.json]
+       python benchmarks/stages.py compare base.json new.json [--threshold 0.2]
+
+The stages are: read (csv), normalize, topology (topopy's build), builder (Builder.build), visit (the tree),
+defaults (add_defaults), attributes (every attribute of every node), save and load (pickle and columnar).
+Each dataset runs in its own process. rss is the peak resident memory (MB) of that process after each stage.
+compare flags the stages that got slower (or the peak memory that grew) by more than the threshold.
+"""
+import argparse
+import json
+import platform
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from regulus.core.data import Data
+from regulus.topo import Regulus
+from regulus.topo.builder import Builder
+from regulus.topo.morse import _complex, _visit, defaults
+from regulus.utils import io
+from regulus.utils.batch import peak_memory, precompute
+
+STAGES = ('read', 'normalize', 'topology', 'builder', 'visit', 'defaults', 'attributes',
+          'save', 'load', 'save_columns', 'load_columns')
+
+
+def gaussians(n, dims, centers=4, noise=0.01, rng=None):
+    """n points in the unit cube, and a sum of centers Gaussians of random positions, widths and signs over them"""
+    rng = rng if rng is not None else np.random.default_rng()
+    x = rng.uniform(size=(n, dims))
+    mu = rng.uniform(0.1, 0.9, size=(centers, dims))
+    sigma = rng.uniform(0.1, 0.3, size=centers)
+    sign = rng.choice([-1, 1], size=centers)
+    d2 = ((x[:, None, :] - mu[None, :, :])**2).sum(axis=2)
+    y = (sign * np.exp(-d2 / (2 * sigma**2))).sum(axis=1) + noise * rng.normal(size=n)
+    return pd.DataFrame(np.c_[x, y], columns=[f'x{i + 1}' for i in range(dims)] + ['y'])
+
+
+def run(n, dims, knn, seed):
+    """The time (and peak memory) of each stage for one dataset"""
+    times, rss = {}, {}
+    clock = [perf_counter()]
+
+    def stage(name):
+        now = perf_counter()
+        times[name], rss[name] = now - clock[0], peak_memory()
+        clock[0] = perf_counter()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = Path(tmp) / 'data.csv'
+        gaussians(n, dims, rng=np.random.default_rng(seed)).to_csv(filename, index=False)
+
+        clock[0] = perf_counter()
+        data = Data.read_csv(filename, dims)
+        stage('read')
+        data.normalize()
+        stage('normalize')
+
+        y = data.values.iloc[:, -1]
+        topo = _complex(defaults.graph, knn, defaults.beta, defaults.norm, defaults.gradient, defaults.aggregator,
+                        defaults.connect, None)
+        topo.build(X=data.x.values.astype(np.float64, copy=False), Y=y.values.astype(np.float64, copy=False))
+        stage('topology')
+
+        builder = Builder().data(y)
+        builder.msc(topo.base_partitions, topo.get_merge_sequence())
+        builder.build()
+        stage('builder')
+
+        regulus = Regulus(data, builder.pts, y.name, type='smale')
+        regulus.tree.root = _visit(builder.root, None, regulus, 0)
+        stage('visit')
+
+        io.add_defaults(regulus)
+        stage('defaults')
+        precompute(regulus, ['all'])
+        stage('attributes')
+
+        io.save(regulus, Path(tmp) / 'data.regulus')
+        stage('save')
+        io.load(Path(tmp) / 'data.regulus')
+        stage('load')
+        io.save(regulus, Path(tmp) / 'data.rgl', format='columns')
+        stage('save_columns')
+        loaded = io.load(Path(tmp) / 'data.rgl')
+        loaded.attr['fitness'][loaded.tree.root]
+        stage('load_columns')
+
+    return dict(n=n, dims=dims, knn=knn, partitions=len([node for node in regulus.tree if node.id >= 0]),
+                times=times, rss=rss, peak=peak_memory())
+
+
+def benchmark(sizes, dims, knn=16, seed=0, repeat=1):
+    """Run every (size, dims) dataset in a fresh process. With repeat > 1 the fastest time of each stage is kept"""
+    results = []
+    fresh = dict(max_tasks_per_child=1) if sys.version_info >= (3, 11) else {}
+    with ProcessPoolExecutor(1, **fresh) as pool:
+        for d in dims:
+            for n in sizes:
+                runs = [pool.submit(run, n, d, knn, seed).result() for _ in range(repeat)]
+                best = runs[0]
+                best['times'] = {name: min(r['times'][name] for r in runs) for name in best['times']}
+                best['peak'] = max(r['peak'] for r in runs)
+                results.append(best)
+                print(_line(best), flush=True)
+    return dict(meta=dict(date=datetime.now().isoformat(timespec='seconds'), python=platform.python_version(),
+                          numpy=np.__version__, platform=platform.platform(), knn=knn, seed=seed, repeat=repeat),
+                results=results)
+
+
+def _line(result):
+    return f"{result['n']:>8} {result['dims']:>4} " + \
+        ' '.join(f"{result['times'].get(name, float('nan')):>8.3f}" for name in STAGES) + f" {result['peak']:>8.0f}"
+
+
+def _header():
+    return f"{'n':>8} {'dims':>4} " + ' '.join(f'{name[:8]:>8}' for name in STAGES) + f" {'peak MB':>8}"
+
+
+def compare(base, new, threshold=0.2, min_time=0.01):
+    """The regressions of new relative to base: stages that are slower (and peaks that are larger) by more than
+    threshold (relative). Stages faster than min_time seconds in both runs are ignored"""
+    regressions = []
+    previous = {(r['n'], r['dims']): r for r in base['results']}
+    for r in new['results']:
+        b = previous.get((r['n'], r['dims']))
+        if b is None:
+            continue
+        for name, t in r['times'].items():
+            t0 = b['times'].get(name)
+            if t0 is not None and max(t, t0) >= min_time and t > t0 * (1 + threshold):
+                regressions.append(dict(n=r['n'], dims=r['dims'], stage=name, base=t0, new=t, ratio=t / max(t0, 1e-9)))
+        if r['peak'] > b['peak'] * (1 + threshold):
+            regressions.append(dict(n=r['n'], dims=r['dims'], stage='peak MB', base=b['peak'], new=r['peak'],
+                                    ratio=r['peak'] / b['peak']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='regulus stage benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+    p = commands.add_parser('run', help='run the benchmarks')
+    p.add_argument('--sizes', type=int, nargs='+', default=[2000, 10000, 50000])
+    p.add_argument('--dims', type=int, nargs='+', default=[2, 4])
+    p.add_argument('--knn', type=int, default=16)
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--repeat', type=int, default=1)
+    p.add_argument('--out', '-o', type=str, help='json output file')
+    p = commands.add_parser('compare', help='compare two runs')
+    p.add_argument('base', type=str)
+    p.add_argument('new', type=str)
+    p.add_argument('--threshold', type=float, default=0.2, help='relative slowdown (or memory growth) to flag')
+    p.add_argument('--min-time', type=float, default=0.01, help='ignore stages faster than this (seconds)')
+    ns = parser.parse_args()
+
+    if ns.command == 'run':
+        print(_header())
+        results = benchmark(ns.sizes, ns.dims, ns.knn, ns.seed, ns.repeat)
+        if ns.out is not None:
+            with open(ns.out, 'w') as f:
+                json.dump(results, f, indent=2)
+        return
+
+    with open(ns.base) as f:
+        base = json.load(f)
+    with open(ns.new) as f:
+        new = json.load(f)
+    regressions = compare(base, new, ns.threshold, ns.min_time)
+    for r in regressions:
+        print(f"{r['n']:>8} {r['dims']:>4} {r['stage']:>12}: {r['base']:.3f} -> {r['new']:.3f} ({r['ratio']:.2f}x)")
+    print(f'{len(regressions)} regressions')
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,64 @@
 import argparse
-from regulus import from_csv, save
+import os
+import sys
+from pathlib import Path
+from regulus.core.data import Data
+from regulus.utils import batch
 
 
 def main():
+    """Build and save the reguli of csv files"""
     parser = argparse.ArgumentParser(description='Regulus')
+    parser.add_argument('inputs', type=str, nargs='+', help='csv files, glob patterns or directories')
+    parser.add_argument('--ndims', '-d', type=int)
+    parser.add_argument('--out', '-o', type=str,
+                        help='output directory, or output file for a single input (default: next to the input)')
+    parser.add_argument('--format', '-f', choices=list(batch.SUFFIX), default='pickle')
+    parser.add_argument('--workers', '-j', type=int, default=1, help='number of processes (0 for all the cores)')
+    parser.add_argument('--knn', '-k', type=int)
+    parser.add_argument('--beta', '-b', type=float)
+    parser.add_argument('--measure', '-m', type=str)
+    parser.add_argument('--precision', choices=['float32', 'float64'])
+    parser.add_argument('--attrs', '-a', type=str, nargs='*', default=[],
+                        help="attributes to compute before saving ('all' for all that aren't dynamic)")
+    parser.add_argument('--force', action='store_true', help='rebuild outputs that are up to date')
+    parser.add_argument('--summary', '-s', type=str, help='write a csv summary of each file')
+
+    ns = parser.parse_args()
+    options = {key: value for key, value in vars(ns).items()
+               if key in ('ndims', 'knn', 'beta', 'measure', 'precision') and value is not None}
+
+    out, output = ns.out, None
+    if out is not None and not Path(out).is_dir() and Path(out).suffix != '' and len(ns.inputs) == 1 \
+            and Path(ns.inputs[0]).is_file():
+        out, output = None, out
+    summaries = batch.process(ns.inputs, out=out, output=output, workers=ns.workers or os.cpu_count(),
+                              format=ns.format, attrs=ns.attrs, force=ns.force, **options)
+    batch.report(summaries)
+    if ns.summary is not None:
+        batch.write_summary(summaries, ns.summary)
+    if any(s['status'] == 'failed' for s in summaries):
+        sys.exit(1)
+
+
+def sweep():
+    """Summarize the Morse-Smale Complexes of a csv file over a grid of knn and beta values"""
+    from regulus.topo.sweep import sweep as run
+    parser = argparse.ArgumentParser(description='Regulus knn/beta parameter sweep')
     parser.add_argument('csv_file',  type=str, help='csv input file')
     parser.add_argument('--ndims', '-d', type=int)
-    parser.add_argument('--out', '-o', type=str)
+    parser.add_argument('--knn', '-k', type=int, nargs='+', default=[8, 16, 32, 64, 100])
+    parser.add_argument('--beta', '-b', type=float, nargs='+', default=[1.0])
+    parser.add_argument('--measure', '-m', type=str)
+    parser.add_argument('--norm', type=str, choices=['feature', 'zscore'])
+    parser.add_argument('--processes', '-p', type=int)
+    parser.add_argument('--out', '-o', type=str, help='csv output file')
 
     ns = parser.parse_args()
-    save(from_csv(ns.filename, ns), ns.out)
+    pts = Data.read_csv(ns.csv_file, ns.ndims)
+    pts.normalize()
+    table = run(pts, knn=ns.knn, beta=ns.beta, measure=ns.measure, processes=ns.processes, norm=ns.norm)
+    print(f'kNN candidates: {table.attrs["candidates_time"]:.3f} s')
+    print(table.to_string(index=False, float_format='{:.4g}'.format))
+    if ns.out is not None:
+        table.to_csv(ns.out, index=False)
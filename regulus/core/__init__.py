@@ -1,5 +1,6 @@
-from .cache import Cache
+from .cache import Cache, vectorized
 from .hasattrs import HasAttrs, AttrRange, UNIT_RANGE
 from .data import Data
+from .groups import Groups
 from .mutable import Mutable
 from .traittypes import *
@@ -5,6 +5,13 @@ def no_op(x):
     return x
 
 
+def vectorized(factory):
+    """Mark a factory as vectorized: it is called as factory(context, arrays), with the TreeArrays of a whole tree,
+    and returns the values of all the tree's nodes"""
+    factory.vectorized = True
+    return factory
+
+
 class ContextCache(ObjectProxy):
     def __init__(self, cache, context):
         super().__init__(cache)
@@ -23,6 +30,7 @@ class ContextCache(ObjectProxy):
             if self.factory is None:
                 return None
             self.cache[key] = self.eval(obj, self._self_context)
+            self.dirty = True
         return self.cache[key]
 
 
@@ -38,6 +46,10 @@ class Cache(object):
         self.dynamic = dynamic
         self.properties = kwargs
         self.save = save
+        # values were added or changed, e.g. since the cache was last saved
+        self.dirty = False
+        # counts the values that were assigned (rather than computed) and the clears
+        self.version = 0
         if self.context is None:
             self.context = self
 
@@ -54,11 +66,22 @@ class Cache(object):
             if self.factory is None:
                 return None
             self.cache[key] = self.eval(obj)
+            self.dirty = True
         return self.cache[key]
 
     def __setitem__(self, obj, value):
+        """Assign a value. The values of the attributes that depend on this one are dropped (see HasAttrs)"""
+        self.put(obj, value)
+        self.version = getattr(self, 'version', 0) + 1
+        owner = getattr(self.context, 'owner', None)
+        if owner is not None:
+            owner.attr_assigned(self)
+
+    def put(self, obj, value):
+        """Store a computed value. Unlike assignment, the attributes that depend on this one are kept"""
         key = self.key(obj)
         self.cache[key] = value
+        self.dirty = True
 
     def get(self, key):
         if key in self.cache:
@@ -67,20 +90,41 @@ class Cache(object):
             return self.parent.get(key)
         return [None, False]
 
+    @property
+    def vectorized(self):
+        return self.properties.get('vectorized', False) or getattr(self.factory, 'vectorized', False)
+
     def eval(self, obj, context=None):
         # print('eval: ', id(self), id(context))
         if self.factory is None:
             return None
         if context is None:
             context = self.context
+        if self.vectorized:
+            return self.eval_column(obj, context)
         if isinstance(obj, tuple):
             return self.factory(context, *obj)
         if self.context is None:
             return self.factory(obj)
         return self.factory(context, obj)
 
+    def eval_column(self, node, context):
+        """Evaluate a vectorized factory for all the nodes of node's tree at once. All the values are cached"""
+        from regulus.tree.arrays import TreeArrays
+        if isinstance(node, tuple):
+            raise TypeError('vectorized attributes are defined for nodes only')
+        arrays = TreeArrays.of(node, context)
+        column = self.factory(context, arrays)
+        values = column.tolist() if hasattr(column, 'tolist') else list(column)
+        for n, value in zip(arrays.nodes, values):
+            self.cache[self.key(n)] = value
+        self.dirty = True
+        return self.cache[self.key(node)]
+
     def clear(self):
         self.cache = {}
+        self.dirty = True
+        self.version = getattr(self, 'version', 0) + 1
 
     def compute(self, obj):
         self.__getitem__(obj)
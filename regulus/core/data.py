@@ -1,16 +1,122 @@
+import warnings
+from copy import copy
+from pathlib import Path
+import numpy as np
 import pandas as pd
 from sklearn.preprocessing import StandardScaler
 
+from .groups import Groups
+
+# number of values processed at a time by the streaming (out of core) passes
+CHUNK = 2**22
+# number of rows read to tell the numeric columns of a csv file
+SAMPLE = 1000
+
+PRECISION = {'float32': np.float32, 'float64': np.float64}
+
+
+def dtype_of(precision):
+    """The numpy dtype of a precision name ('float32' or 'float64') or dtype"""
+    return np.dtype(PRECISION.get(precision, precision))
+
+
+def _count_lines(filename, block=2**24):
+    """An upper bound on the number of rows of a csv file: the number of lines after the header"""
+    lines, last = 0, b'\n'
+    with open(filename, 'rb') as f:
+        while True:
+            buffer = f.read(block)
+            if not buffer:
+                break
+            lines += buffer.count(b'\n')
+            last = buffer[-1:]
+    if last != b'\n':
+        lines += 1
+    return max(lines - 1, 0)
+
+
+def _numeric_columns(filename, usecols=None):
+    """The columns to read: usecols, or the numeric columns of the first SAMPLE rows of the file"""
+    header = list(pd.read_csv(filename, nrows=0).columns)
+    if usecols is not None:
+        return [header[c] if isinstance(c, (int, np.integer)) else c for c in usecols]
+    sample = pd.read_csv(filename, nrows=SAMPLE)
+    numeric = [c for c in header if pd.api.types.is_numeric_dtype(sample[c])]
+    if len(numeric) < len(header):
+        warnings.warn(f'{filename}: skipping the columns that are not numbers: '
+                      f'{[c for c in header if c not in numeric]}')
+    return numeric
+
+
+def _truncate_npy(path, rows):
+    """Truncate a .npy file of a 2d array to its first rows, in place"""
+    with open(path, 'r+b') as f:
+        version = np.lib.format.read_magic(f)
+        read, write = (np.lib.format.read_array_header_1_0, np.lib.format.write_array_header_1_0) \
+            if version == (1, 0) else (np.lib.format.read_array_header_2_0, np.lib.format.write_array_header_2_0)
+        shape, fortran_order, dtype = read(f)
+        offset = f.tell()
+        f.seek(0)
+        write(f, dict(descr=np.lib.format.dtype_to_descr(dtype), fortran_order=fortran_order,
+                      shape=(rows,) + tuple(shape[1:])))
+        if f.tell() != offset:
+            raise ValueError(f'can not truncate {path} in place')
+        f.truncate(offset + rows * int(np.prod(shape[1:], dtype=np.int64)) * dtype.itemsize)
+
 
 class Data(object):
+    """The points (x) and their values. x and values are DataFrames, possibly over memory mapped arrays (see from_npy)"""
+
     def __init__(self, x, values):
         self.x = pd.DataFrame(x)
         self.values = pd.DataFrame(values)
         self.scaler = None
+        self.path = None
+        self.groups = None
+        self.raw = None
 
     @staticmethod
-    def read_csv(filename, ndims=None):
-        return Data.from_df(pd.read_csv(filename), ndims=ndims)
+    def read_csv(filename, ndims=None, dtype=np.float64, usecols=None, chunksize=None, path=None):
+        """Read a csv file of numbers in chunks, directly into one preallocated array.
+
+        The numeric columns are parsed as dtype (a dtype or a precision name), the others are skipped with a
+        warning. usecols (names or positions) selects the columns instead, which must then all be numbers. The
+        array is memory mapped to the .npy file path if one is given, so the data doesn't need to fit in memory.
+        The first ndims of the columns are the points and the rest are their values.
+        """
+        columns = _numeric_columns(filename, usecols)
+        lines = _count_lines(filename)
+        if chunksize is None:
+            chunksize = max(1, CHUNK // 4 // max(1, len(columns)))
+
+        dtype = dtype_of(dtype)
+        shape = (lines, len(columns))
+        if path is not None:
+            pts = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+        else:
+            pts = np.empty(shape, dtype=dtype)
+
+        n = 0
+        for chunk in pd.read_csv(filename, usecols=columns, dtype=dtype, chunksize=chunksize):
+            pts[n:n+len(chunk)] = chunk[columns].values
+            n += len(chunk)
+        if n < lines:
+            # blank lines, or quoted line breaks
+            if path is not None:
+                pts.flush()
+                del pts
+                _truncate_npy(path, n)
+                pts = np.load(path, mmap_mode='r+')
+            else:
+                pts = pts[:n].copy()
+
+        if ndims is None:
+            ndims = len(columns) - 1
+        data = Data(pd.DataFrame(pts[:, :ndims], columns=columns[:ndims], copy=False),
+                    pd.DataFrame(pts[:, ndims:], columns=columns[ndims:], copy=False))
+        if path is not None:
+            data.path = Path(path)
+        return data
 
     @staticmethod
     def from_pts(pts, cols=None, ndims=None):
@@ -23,25 +129,103 @@ class Data(object):
         return Data(x, values)
 
     @staticmethod
-    def from_df(pts, ndims=None):
+    def from_df(pts, ndims=None, precision=None):
         if ndims is None:
             ndims = pts.shape[1] - 1
         cols = list(pts.columns)
         x = pts.loc[:, cols[:ndims]]
         values = pts.loc[:, cols[ndims:]]
-        return Data(x, values)
+        data = Data(x, values)
+        if precision is not None:
+            data.set_precision(precision)
+        return data
+
+    @property
+    def precision(self):
+        return self.x.values.dtype.name
+
+    def set_precision(self, precision):
+        """Convert x and values to precision ('float32' or 'float64'). Memory mapped data is read into memory"""
+        dtype = dtype_of(precision)
+        if self.x.values.dtype != dtype:
+            self.x = self.x.astype(dtype)
+            self.path = None
+        if any(t != dtype for t in self.values.dtypes):
+            self.values = self.values.astype(dtype)
+        return self
+
+    def as_precision(self, precision):
+        """A Data in precision ('float32' or 'float64') that shares whatever needs no conversion. self is unchanged"""
+        return copy(self).set_precision(precision)
+
+    @staticmethod
+    def from_npy(x, values, x_columns=None, value_columns=None, mmap=True):
+        """Data over .npy files. The arrays are memory mapped (read only) unless mmap is False"""
+        mode = 'r' if mmap else None
+        data = Data(pd.DataFrame(np.load(x, mmap_mode=mode), columns=x_columns, copy=False),
+                    pd.DataFrame(np.load(values, mmap_mode=mode), columns=value_columns, copy=False))
+        data.path = Path(x) if mmap else None
+        return data
 
-    def normalize(self, scaler=None, copy=False):
+    @property
+    def mapped(self):
+        return self.path is not None
+
+    def normalize(self, scaler=None, copy=False, path=None, chunk=CHUNK):
+        """Standardize x.
+
+        Memory mapped data is normalized out of core: the scaler is fitted in one streaming pass (partial_fit) and
+        the normalized points are written, a chunk at a time, to another memory mapped .npy file (by default next
+        to the original one)
+        """
         if scaler is None:
             scaler = StandardScaler(copy=copy)
         self.scaler = scaler
-        self.x = pd.DataFrame(self.scaler.fit_transform(self.x), columns=self.x.columns)
+        if not self.mapped:
+            self.x = pd.DataFrame(self.scaler.fit_transform(self.x), columns=self.x.columns)
+            return
+
+        x = self.x
+        rows = max(1, chunk // max(1, x.shape[1]))
+        for first in range(0, len(x), rows):
+            scaler.partial_fit(x.iloc[first:first+rows])
+
+        path = Path(path) if path is not None else self.path.with_name(self.path.stem + '.normalized.npy')
+        out = np.lib.format.open_memmap(path, mode='w+', dtype=x.values.dtype, shape=x.shape)
+        for first in range(0, len(x), rows):
+            out[first:first+rows] = scaler.transform(x.iloc[first:first+rows], copy=True)
+        out.flush()
+        del out
+        self.x = pd.DataFrame(np.load(path, mmap_mode='r'), columns=self.x.columns, copy=False)
+        self.path = path
+
+    def aggregate(self, reducer='mean', decimals=None):
+        """The data without duplicate points: one row per group of equal rows of x (rounded to decimals, if given),
+        with the group's values aggregated by reducer (see Groups.reduce).
+
+        The result's groups map its rows back to the rows of this data, which it keeps as raw. Without duplicates
+        the data itself is returned
+        """
+        groups = Groups.of(self.x.values, decimals)
+        if groups.duplicates == 0:
+            return self
+        data = Data(self.x.iloc[groups.first].reset_index(drop=True), groups.reduce(self.values, reducer))
+        data.scaler = self.scaler
+        data.groups = groups
+        data.raw = self
+        return data
+
+    def expand(self, idx):
+        """The raw rows of the given rows (all of them, for aggregated data)"""
+        groups = getattr(self, 'groups', None)
+        return np.asarray(idx, dtype=np.int64) if groups is None else groups.expand(idx)
 
     def size(self):
         return len(self.values)
 
     def inverse(self, values):
-        return values if self.scaler is None else pd.DataFrame(self.scaler.inverse_transform(values, copy=True), columns=values.columns)
+        return values if self.scaler is None else \
+            pd.DataFrame(self.scaler.inverse_transform(values, copy=True), columns=values.columns, index=values.index)
 
     def y(self, measure):
         return self.values[measure]
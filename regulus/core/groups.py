@@ -0,0 +1,79 @@
+"""Duplicate points: the groups of equal rows of x, and the aggregation of their values (see Data.aggregate)"""
+import numpy as np
+import pandas as pd
+
+REDUCERS = ('mean', 'min', 'max', 'median', 'first', 'last')
+
+_PRIME = np.uint64(0x100000001b3)
+_SEED = np.uint64(0xcbf29ce484222325)
+
+
+def row_hashes(x):
+    """A 64 bit (FNV-1a like) hash of each row of a 2d float array. 0.0 and -0.0 hash the same"""
+    bits = np.ascontiguousarray(np.asarray(x, dtype=np.float64) + 0.0).view(np.uint64)
+    h = np.full(len(bits), _SEED, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for j in range(bits.shape[1]):
+            h ^= bits[:, j]
+            h *= _PRIME
+            h ^= h >> np.uint64(29)
+    return h
+
+
+class Groups(object):
+    """The groups of equal rows: inverse[i] is the group (aggregated row) of row i.
+
+    The groups are numbered in the order of their first row. members[offsets[g]:offsets[g+1]] are the rows of
+    group g, in their original order
+    """
+
+    def __init__(self, inverse):
+        self.inverse = np.asarray(inverse, dtype=np.int64)
+        self.counts = np.bincount(self.inverse)
+        self.offsets = np.r_[0, np.cumsum(self.counts)]
+        self.members = np.argsort(self.inverse, kind='stable')
+
+    @staticmethod
+    def of(x, decimals=None):
+        """The groups of the equal rows of x, rounded to decimals (if given) first"""
+        x = np.asarray(x, dtype=np.float64)
+        if decimals is not None:
+            x = x.round(decimals)
+        _, first, inverse = np.unique(row_hashes(x), return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        if not np.array_equal(x, x[first[inverse]], equal_nan=True):
+            # a hash collision: fall back to comparing the rows themselves
+            _, first, inverse = np.unique(x, axis=0, return_index=True, return_inverse=True)
+            inverse = inverse.reshape(-1)
+        # number the groups by their first row
+        rank = np.empty(len(first), dtype=np.int64)
+        rank[np.argsort(first, kind='stable')] = np.arange(len(first))
+        return Groups(rank[inverse])
+
+    def __len__(self):
+        return len(self.counts)
+
+    @property
+    def first(self):
+        """The first row of each group"""
+        return self.members[self.offsets[:-1]]
+
+    @property
+    def duplicates(self):
+        return len(self.inverse) - len(self.counts)
+
+    def expand(self, groups):
+        """The original rows of the given groups (aggregated rows), group by group"""
+        groups = np.asarray(groups, dtype=np.int64)
+        counts = self.counts[groups]
+        starts = np.repeat(self.offsets[groups] - np.r_[0, np.cumsum(counts)[:-1]], counts)
+        return self.members[starts + np.arange(counts.sum())]
+
+    def reduce(self, values, reducer='mean'):
+        """The values aggregated over each group. reducer is one of REDUCERS or a function of a group's values"""
+        if isinstance(reducer, str) and reducer not in REDUCERS:
+            raise ValueError(f'unknown reducer {reducer}. Known reducers: {list(REDUCERS)}')
+        frame = pd.DataFrame(values)
+        reduced = frame.groupby(self.inverse, sort=True).agg(reducer)
+        reduced.index = pd.RangeIndex(len(reduced))
+        return reduced
@@ -83,6 +83,7 @@ class HasAttrs(HasTraits):
     def __init__(self, parent=None, auto=()):
         super().__init__()
         # print('HasAttrs', id(self))
+        self.changed = set()
         self.parent = parent
         range = None
         if parent is not None:
@@ -90,13 +91,19 @@ class HasAttrs(HasTraits):
 
         # self.attr = Cache(parent, factory=None, range=range, context=None)
         self.attr = HasAttrCache(parent)
+        self.attr.owner = self
         self.auto = []
         self.dependencies = defaultdict(list)
         for entry in auto:
             self.add_attr(*entry)
 
-    def add_attr(self, factory, name=None, dynamic=False, key=_attr_key, range=None, requires=(), save=True, **kwargs):
-        """override previous attribute if one exists"""
+    def add_attr(self, factory, name=None, dynamic=False, key=_attr_key, range=None, requires=(), save=True,
+                 vectorized=False, **kwargs):
+        """override previous attribute if one exists.
+
+        A vectorized factory is called once per tree, as factory(context, arrays), and returns a column of values
+        for all the nodes in arrays.nodes (see TreeArrays). Factories decorated with @vectorized are always vectorized.
+        """
         if name is None:
             if factory.__name__ == '<lambda>':
                 print('Error: a name must be given for a lambda expression')
@@ -113,7 +120,10 @@ class HasAttrs(HasTraits):
             op = 'add'
         else:
             op = 'change'
+        if vectorized:
+            kwargs['vectorized'] = True
         self.attr[name] = Cache(key=key, factory=factory, dynamic=dynamic, context=self.attr, range=range, save=save, **kwargs)
+        self.mark_changed(name)
         self.state = (op, name)
 
         self.reset_dependents(name)
@@ -124,6 +134,12 @@ class HasAttrs(HasTraits):
         # else:
         #     self.auto.append([factory, name, key, range])
 
+    def mark_changed(self, name):
+        """Remember that attribute name was added or changed, e.g. since the last (incremental) save"""
+        if 'changed' not in self.__dict__:
+            self.changed = set()
+        self.changed.add(name)
+
     def update_attr(self, factory, name=None):
         if name is None:
             if factory.__name__ == '<lambda>':
@@ -132,6 +148,7 @@ class HasAttrs(HasTraits):
             name = factory.__name__
         if name in self.attr:
             self.attr[name].factory = factory
+            self.mark_changed(name)
             self.state = ('change', name)
             self.reset_dependents(name)
         else:
@@ -140,6 +157,7 @@ class HasAttrs(HasTraits):
     def clear_attr(self, name):
         if name in self.attr:
             self.attr[name].clear()
+            self.mark_changed(name)
             self.state = ('change', name)
         else:
             raise ValueError(f'Attribute {name} not found')
@@ -148,9 +166,16 @@ class HasAttrs(HasTraits):
         for d in self.dependencies[name]:
             self.clear_attr(d)
 
+    def attr_assigned(self, cache):
+        """A value of cache was assigned: drop the values of the attributes that depend on it"""
+        for name, value in list(self.attr.cache.items()):
+            if value is cache:
+                self.reset_dependents(name)
+
     def alias(self, new, old):
         if old in self.attr:
             self.attr[new] = self.attr[old]
+            self.mark_changed(new)
             self.reset_dependents(new)
         else:
             raise ValueError(f'Attribute {old} not found')
@@ -160,7 +185,9 @@ class HasAttrs(HasTraits):
         return attr in self.attr
 
     def __setstate__(self, state):
-        self.__dict__.update(state)
+        # HasTraits restores the state and registers the observers again
+        super().__setstate__(state)
+        self.attr.owner = self
         # for factory, name, key, range in self.auto:
         #     # self.attr[name].factory = factory
         #     self.attr[name].factory = _wrap_factory(self.attr, factory)
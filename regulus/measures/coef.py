@@ -1,20 +1,73 @@
-from sklearn.metrics.pairwise import cosine_similarity
+import numpy as np
+
+from regulus.tree.batch import fill_tree
+from regulus.tree.traverse import depth_first
+
+
+def _normalize(m):
+    norm = np.linalg.norm(m, axis=1, keepdims=True)
+    return m / np.where(norm > 0, norm, 1)
+
+
+def cosine(a, b):
+    """Row-wise cosine similarity of two (n x d) matrices. Zero rows have a similarity of 0"""
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    return np.einsum('ij,ij->i', _normalize(a), _normalize(b))
+
+
+def coef_matrix(models):
+    """The models' coefficients as rows of one matrix, zero padded, and the number of coefficients of each row"""
+    coefs = [np.ravel(getattr(m, 'coef_', ())) for m in models]
+    size = np.array([len(c) for c in coefs], dtype=int)
+    matrix = np.zeros((len(coefs), size.max(initial=0)))
+    for i, c in enumerate(coefs):
+        matrix[i, :len(c)] = c
+    return matrix, size
+
+
+def _similarity(models, other_models):
+    """Cosine similarity of the coefficients of pairs of models. None where the numbers of coefficients differ"""
+    a, a_size = coef_matrix(models)
+    b, b_size = coef_matrix(other_models)
+    width = max(a.shape[1], b.shape[1])
+    a = np.pad(a, ((0, 0), (0, width - a.shape[1])))
+    b = np.pad(b, ((0, 0), (0, width - b.shape[1])))
+    v = cosine(a, b)
+    return [float(s) if n == m and n > 0 else None for s, n, m in zip(v, a_size, b_size)]
+
+
+def coef_batch(context, root):
+    """coef_change of all the nodes under root, computed together"""
+    model = context['model']
+    nodes = [node for node in depth_first(root) if node.id >= 0 and node.parent is not None and node.parent.id >= 0]
+    values = _similarity([model[node] for node in nodes], [model[node.parent] for node in nodes])
+    return dict(zip(nodes, values))
 
 
 def coef_change(context, node):
     if node.id < 0 or node.parent.id < 0:
         return None
+    return fill_tree(context, 'coef_change', node, coef_batch, _coef_change)
+
+
+def _coef_change(context, node):
+    if node.id < 0 or node.parent is None or node.parent.id < 0:
+        return None
+    return _similarity([context['model'][node]], [context['model'][node.parent]])[0]
+
 
-    n_coef = context['model'][node].coef_
-    p_coef = context['model'][node.parent].coef_
-    if len(n_coef) == len(p_coef) :
-        return cosine_similarity([n_coef], [p_coef])[[0][0]][0]
-    return None
+def similarity_batch(context, root):
+    """coef_similarity of all the nodes under root, computed together"""
+    nodes = [node for node in depth_first(root) if node.id >= 0]
+    values = _similarity([context['model'][node] for node in nodes],
+                         [context['shared_model'][node] for node in nodes])
+    return dict(zip(nodes, values))
 
 
 def coef_similarity(context, node):
-    n_coef = context['model'][node].coef_
-    s_coef = context['shared_model'][node].coef_
-    if len(n_coef) == len(s_coef):
-        return cosine_similarity([n_coef], [s_coef])[[0][0]][0]
-    return None
+    return fill_tree(context, 'coef_similarity', node, similarity_batch, _coef_similarity)
+
+
+def _coef_similarity(context, node):
+    return _similarity([context['model'][node]], [context['shared_model'][node]])[0]
@@ -1,13 +1,29 @@
-from sklearn.metrics.pairwise import cosine_similarity
+import numpy as np
+
+from regulus.models.linear_fit import LinearFit
+from regulus.models.moments import r2_dims
+from regulus.tree.batch import fill_tree
+from regulus.tree.traverse import depth_first
+from .coef import cosine
+
+
+def _dim_scores(models, partition):
+    """R^2 of each univariate model on the partition. Linear fits are scored in closed form"""
+    if all(isinstance(m, LinearFit) for m in models):
+        n, mean, s = partition.regulus.moments.of(partition)
+        coef = np.array([m.coef_[0] for m in models])
+        intercept = np.array([m.intercept_ for m in models])
+        return r2_dims(n, mean, s, coef, intercept).tolist()
+    return [m.score(partition.x[[d]], partition.y) for m, d in zip(models, partition.x.columns)]
 
 
 def dim_score(context, node):
     partition = node.data
-    if partition.y.size < 2:
-        return [0] * len(partition.x.columns)
+    moments = partition.regulus.moments
+    if moments.of(partition)[0] < 2:
+        return [0] * moments.dims
 
-    models = context['dim_model'][node]
-    return [m.score(partition.x[[d]], partition.y) for m, d in zip(models, partition.x.columns)]
+    return _dim_scores(context['dim_model'][node], partition)
 
 
 def dim_min(context, node):
@@ -19,22 +35,38 @@ def dim_max(context, node):
 
 
 def dim_relative(context, has_models, has_points):
-    if len(has_points.data.y) < 2:
-        return [0] * len(has_points.data.x.columns)
+    moments = has_points.data.regulus.moments
+    if moments.of(has_points.data)[0] < 2:
+        return [0] * moments.dims
+
+    return _dim_scores(context['dim_model'][has_models], has_points.data)
+
+
+def dims_batch(context, root, name):
+    """dim_parent or dim_child (name) of all the nodes under root, computed together"""
+    nodes = [node for node in depth_first(root) if node.parent is not None]
+    if len(nodes) == 0:
+        return {}
+    score = [context['dim_score'][node] for node in nodes]
+    relative = [context['dim_relative'][_relative(node, name)] for node in nodes]
+    return dict(zip(nodes, cosine(score, relative).tolist()))
+
+
+def _relative(node, name):
+    return (node.parent, node) if name == 'dim_parent' else (node, node.parent)
+
 
-    models = context['dim_model'][has_models]
-    return [m.score(has_points.data.x[[d]], has_points.data.y) for m, d in zip(models, has_points.data.x.columns)]
+def _dim_similarity(context, node, name):
+    if node.parent is None:
+        return None
+    return float(cosine([context['dim_score'][node]], [context['dim_relative'][_relative(node, name)]])[0])
 
 
 def dim_parent(context, node):
-    v = cosine_similarity(
-            [context['dim_score'][node]],
-            [context['dim_relative'][node.parent, node]])
-    return v[0][0]
+    return fill_tree(context, 'dim_parent', node, lambda c, root: dims_batch(c, root, 'dim_parent'),
+                     lambda c, n: _dim_similarity(c, n, 'dim_parent'))
 
 
 def dim_child(context, node):
-    v = cosine_similarity(
-        [context['dim_score'][node]],
-        [context['dim_relative'][node, node.parent]])
-    return v[0][0]
+    return fill_tree(context, 'dim_child', node, lambda c, root: dims_batch(c, root, 'dim_child'),
+                     lambda c, n: _dim_similarity(c, n, 'dim_child'))
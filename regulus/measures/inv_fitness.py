@@ -1,8 +1,41 @@
+from regulus.tree.batch import fill_tree
+from regulus.tree.traverse import depth_first
 
 
-def inv_fitness(t,n):
+def edge_inv_fitness(t, root, curves):
+    """inv_fitness of every parent/child edge under root, computed with one masked array operation"""
+    edges = []
+    for node in depth_first(root):
+        if node.id == -1 or node.parent is None or node.parent.id == -1:
+            continue
+        row, parent_row = curves.row(node.data), curves.row(node.parent.data)
+        if row is not None and parent_row is not None:
+            edges.append((node, row, parent_row))
+    if len(edges) == 0:
+        return {}
+
+    nodes, rows, parent_rows = zip(*edges)
+    values = curves.fitness(list(rows), list(parent_rows))
+    return {node: None if curves.size[row] < 10 or curves.size[parent_row] < 10 else float(value)
+            for node, row, parent_row, value in zip(nodes, rows, parent_rows, values)}
+
+
+def inv_fitness(t, n):
+    if n.id == -1 or n.parent.id == -1:
+        return None
+
+    # curves that were computed (or loaded) already are used as they are, rather than building the shared curves
+    computed = len(getattr(t['inverse_regression'], 'cache', ())) > 0
+    curves = n.data.regulus.inverse_curves_of('inverse_regression', t, build=not computed)
+    if curves is not None:
+        # the curves share one grid: evaluate all the edges of the tree at once
+        return fill_tree(t, 'inv_fitness', n, lambda c, root: edge_inv_fitness(c, root, curves), _inv_fitness)
+    return _inv_fitness(t, n)
+
+
+def _inv_fitness(t, n):
     p = n.parent
-    if n.id == -1 or p.id == -1:
+    if n.id == -1 or p is None or p.id == -1:
         return None
     if len(n.data.y) < 10 or len(p.data.y) < 10:
         return None
@@ -10,4 +43,4 @@ def inv_fitness(t,n):
     pc = t['inverse_regression'][p][0]
     d = (pc-nc).dropna()
     d2 = (d*d).sum()/len(d)
-    return -d2.max()
\ No newline at end of file
+    return -d2.max()
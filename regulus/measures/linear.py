@@ -1,50 +1,146 @@
 import numpy as np
-from sklearn import linear_model as lm
+
+from regulus.models.linear_fit import LinearFit
+from regulus.models.moments import r2, stepwise_r2
+from regulus.models.null_model import NullModel
+from regulus.tree.batch import fill_tree
+from regulus.tree.traverse import depth_first
+
+
+def _size(partition):
+    return partition.regulus.moments.of(partition)[0]
+
+
+def _score(model, partition, name=None):
+    """R^2 of model on the partition's points.
+
+    Linear fits are scored in closed form from the partition's moments. Otherwise, if model is the partition's own
+    model of attribute name, the score is read from the attribute's cached predictions
+    """
+    if isinstance(model, LinearFit):
+        n, mean, s = partition.regulus.design_moments(model.degree).of(partition)
+        if s is not None:
+            return float(r2(n, mean, s, model.coef_, model.intercept_))
+    if name is not None:
+        score = partition.regulus.predictions(name).score(partition)
+        if score is not None:
+            return score
+    return model.score(partition.x, partition.y)
 
 
 def fitness(context, node):
-    if len(node.data.y) < 2:
+    if _size(node.data) < 2:
         return None
-    return context['model'][node].score(node.data.x, node.data.y)
+    return _score(context['model'][node], node.data, 'model')
 
 
 def stepwise_fitness(context, node):
-    fitness = []
-    coefficients = np.fabs(context['model'][node].coef_)
-    sorted_dims = np.argsort(coefficients)
-    for i in range(len(sorted_dims)):
-        subspace = sorted_dims[:(i+1)]
-        model = lm.LinearRegression()
-        X = node.data.x[:, subspace]
-        Y = node.data.y
-        model.fit(X, Y)
-        fitness.append((sorted_dims[i], model.score(X, Y)))
-    return fitness
+    """R^2 of forward selection: fits on the dimensions added one at a time, by increasing |coef| of the model.
+
+    Returns a list of (dim, R^2 of the fit with dim and all the dimensions before it)
+    """
+    return fill_tree(context, 'stepwise_fitness', node, stepwise_batch, _stepwise_fitness)
+
+
+def _stepwise_fitness(context, node):
+    moments = node.data.regulus.moments
+    coef = np.asarray(context['model'][node].coef_)
+    n, _, s = moments.of(node.data)
+    if n < 2 or len(coef) != moments.dims:
+        return []
+    order = np.argsort(np.fabs(coef))
+    return list(zip(order.tolist(), stepwise_r2(s, order).tolist()))
+
+
+def stepwise_batch(context, root):
+    """stepwise_fitness of all the nodes under root, computed together"""
+    moments = root.data.regulus.moments
+    values, nodes, rows, coefs = {}, [], [], []
+    for node in depth_first(root):
+        row = moments.row(node.data)
+        if node.id == -1 or row is None:
+            continue
+        coef = np.asarray(context['model'][node].coef_)
+        if moments.count[row] >= 2 and len(coef) == moments.dims:
+            nodes.append(node)
+            rows.append(row)
+            coefs.append(coef)
+        else:
+            values[node] = []
+    if len(nodes) == 0:
+        return values
+
+    order = np.argsort(np.fabs(np.array(coefs)), axis=1)
+    scores = stepwise_r2(moments.scatter[rows], order)
+    for node, dims, score in zip(nodes, order.tolist(), scores.tolist()):
+        values[node] = list(zip(dims, score))
+    return values
 
 
 def relative_fitness(context, has_model, has_pts):
-    if len(has_pts.data.y) < 2:
+    if _size(has_pts.data) < 2:
         return 0
-    return context['model'][has_model].score(has_pts.data.x, has_pts.data.y)
+    return _score(context['model'][has_model], has_pts.data)
+
+
+def _linear(model):
+    return isinstance(model, NullModel) or isinstance(model, LinearFit) and model.degree == 1
+
+
+def _edges(root):
+    """The parent/child pairs of the tree, in both directions"""
+    return [pair for node in depth_first(root) if node.id != -1 and node.parent is not None and node.parent.id != -1
+            for pair in ((node.parent, node), (node, node.parent))]
+
+
+def edge_fitness(context, root):
+    """relative_fitness of every parent/child edge under root, in both directions, computed in one pass.
+
+    Only the edges whose model is a linear fit (or a NullModel) are computed; the others are left out.
+    """
+    model = context['model']
+    pairs = [pair for pair in _edges(root) if _linear(model[pair[0]])]
+    if len(pairs) == 0:
+        return {}
+
+    moments = root.data.regulus.moments
+    d = moments.dims
+    coef = np.zeros((len(pairs), d))
+    intercept = np.zeros(len(pairs))
+    rows = np.zeros(len(pairs), dtype=int)
+    valid = np.zeros(len(pairs), dtype=bool)
+    for i, (has_model, has_pts) in enumerate(pairs):
+        m = model[has_model]
+        row = moments.row(has_pts.data)
+        if isinstance(m, LinearFit) and row is not None and moments.count[row] >= 2:
+            coef[i], intercept[i], rows[i], valid[i] = m.coef_, m.intercept_, row, True
+
+    scores = np.zeros(len(pairs))
+    scores[valid] = moments.cross_score(coef[valid], intercept[valid], rows[valid])
+    return {pair: float(score) for pair, score in zip(pairs, scores)}
+
+
+def _relative_fitness(context, has_model, has_pts):
+    cache = context['relative_fitness']
+    if (has_model, has_pts) in cache:
+        return cache[has_model, has_pts]
+    return fill_tree(context, 'relative_fitness', (has_model, has_pts), edge_fitness, relative_fitness, keys=_edges)
 
 
 def parent_fitness(context, node):
     if node.id == -1 or node.parent.id == -1:
         return None
-    return context['relative_fitness'][node.parent, node]
+    return _relative_fitness(context, node.parent, node)
 
 
 def child_fitness(context, node):
     if node.id == -1 or node.parent.id == -1:
         return None
-    return context['relative_fitness'][node, node.parent]
+    return _relative_fitness(context, node, node.parent)
 
 
 def shared_fitness(context, node):
     model = context['shared_model'][node]
-    if model is None or len(node.data.y) < 2:
+    if model is None or _size(node.data) < 2:
         return None
-    return model.score(node.data.x, node.data.y)
-
-
-
+    return _score(model, node.data, 'shared_model')
@@ -1,24 +1,38 @@
 import random
+import numpy as np
 
+from regulus.core.cache import vectorized
 
-def node_size(context, node):
-    return node.data.size()
 
+@vectorized
+def node_size(context, arrays):
+    return arrays.size
 
-def node_relative_size(context, node):
-    return node.data.size()/context['data_size']
 
+@vectorized
+def node_relative_size(context, arrays):
+    return arrays.size / context['data_size']
 
-def node_span(context, node):
-    return node.parent.data.persistence - node.data.persistence
 
+@vectorized
+def node_span(context, arrays):
+    parent = arrays.persistence[np.maximum(arrays.parent, 0)]
+    return np.where(arrays.parent >= 0, parent - arrays.persistence, 0)
 
-def node_max(context, node):
-    return node.data.max()
 
+@vectorized
+def node_persistence(context, arrays):
+    return arrays.persistence
 
-def node_min(context, node):
-    return node.data.min()
+
+@vectorized
+def node_max(context, arrays):
+    return arrays.regulus.y.values[arrays.minmax[:, 1]]
+
+
+@vectorized
+def node_min(context, arrays):
+    return arrays.regulus.y.values[arrays.minmax[:, 0]]
 
 
 def unique_id(context, id):
@@ -1,2 +1,5 @@
+from .linear import _score
+
+
 def quadratic_fitness(context, node):
-    return context['quadratic'][node].score(node.data.x, node.data.y)
+    return _score(context['quadratic'][node], node.data, 'quadratic')
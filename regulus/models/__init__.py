@@ -1,4 +1,9 @@
+from .moments import Moments
+from .linear_fit import LinearFit
+from .model_table import ModelTable, compact, compact_cache, compact_models, tabulate
 from .linear_model import *
 from .quadratic_model import *
 from .inv_reg import *
+from .inv_curves import InverseCurves
+from .predictions import Predictions
 
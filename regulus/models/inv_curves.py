@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+from .inv_reg import N, gaussian, inverse, inverse_lowess, inverse_lowess_std
+
+
+class InverseCurves(object):
+    """Inverse regression curves of all the partitions, sampled on one grid shared by the whole tree.
+
+    The grid spans the data range. Each partition's curve and std are stored in (partitions x grid x dims) arrays,
+    with NaN at the grid points outside of the partition's range (mask is False there). The curves are in the
+    original (unscaled) coordinates.
+    """
+
+    def __init__(self, regulus, bandwidth_factor=0.2, n=N, method='exact'):
+        self.regulus = regulus
+        self.bandwidth_factor = bandwidth_factor
+        self.method = method
+        self.grid = np.linspace(*regulus.attr['data_range'], n)
+        self.index = {}
+        self.size = None
+        self.mask = None
+        self.curve = None
+        self.std = None
+        self._compute()
+
+    def _compute(self):
+        regulus = self.regulus
+        x = regulus.x.values
+        y = regulus.y.values
+        scaler = regulus.scaler
+        partitions = [p for p in regulus.tree.partitions() if p.id >= 0]
+
+        n, d = len(partitions), x.shape[1]
+        self.index = {p.id: i for i, p in enumerate(partitions)}
+        self.size = np.zeros(n, dtype=int)
+        self.mask = np.zeros((n, len(self.grid)), dtype=bool)
+        self.curve = np.full((n, len(self.grid), d), np.nan)
+        self.std = np.full((n, len(self.grid), d), np.nan)
+
+        for i, partition in enumerate(partitions):
+            idx = np.asarray(partition.idx, dtype=int)
+            self.size[i] = len(idx)
+            if len(idx) < 2:
+                continue
+            px, py = x[idx], y[idx]
+            mask = (self.grid >= np.amin(py)) & (self.grid <= np.amax(py))
+            S = self.grid[mask]
+            if len(S) < 2:
+                continue
+
+            kernel = gaussian(self.bandwidth_factor * (partition.max() - partition.min()))
+            line = inverse_lowess(px, py, S, kernel)
+            std = inverse_lowess_std(px, py, S, kernel=kernel, method=self.method)
+            if scaler is not None:
+                line = scaler.inverse_transform(line)
+                std = std * scaler.scale_
+
+            self.mask[i] = mask
+            self.curve[i, mask] = line
+            self.std[i, mask] = std
+
+    def row(self, partition):
+        return self.index.get(partition.id, None) if partition.id >= 0 else None
+
+    def frames(self, partition):
+        """The partition's (curve, std) as DataFrames indexed by the grid, as returned by inverse()"""
+        row = self.row(partition)
+        if row is None:
+            if partition.y.size < 2:
+                return []
+            S = self.grid[(self.grid >= np.amin(partition.y)) & (self.grid <= np.amax(partition.y))]
+            kernel = gaussian(self.bandwidth_factor * (partition.max() - partition.min()))
+            return inverse(partition.x, partition.y, kernel, S, self.regulus.scaler, method=self.method)
+
+        if self.size[row] < 2:
+            return []
+        columns = self.regulus.x.columns
+        mask = self.mask[row]
+        index = pd.Index(self.grid[mask], name=self.regulus.y.name)
+        return pd.DataFrame(self.curve[row, mask], index=index, columns=columns), \
+            pd.DataFrame(self.std[row, mask], index=index, columns=columns)
+
+    def fitness(self, rows, other_rows):
+        """Negative of the largest (over dimensions) mean squared difference between pairs of curves.
+
+        The mean is taken over the grid points shared by both curves. Returns NaN for curves that don't overlap.
+        """
+        valid = self.mask[rows] & self.mask[other_rows]
+        diff = np.where(valid[..., None], self.curve[other_rows] - self.curve[rows], 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            d2 = (diff * diff).sum(axis=1) / valid.sum(axis=1)[:, None]
+        return -d2.max(axis=1)
@@ -5,70 +5,179 @@ import pandas as pd
 SIGMA = 0.1
 N = 40
 
+# inverse_lowess_std: relative kernel weight below which samples are ignored ('window', 1e-3 is 3.7 sigma),
+# and number of exact local fits ('binned')
+TOL = 1e-3
+BINS = 256
+
+
+# max number of kernel weights evaluated at once by the batched regressions
+CHUNK = 2**22
+
 
 def radial_kernel(x0, X, sigma):
-    return np.exp(np.sum((X - x0) ** 2, axis=1) / (-2 * sigma * sigma))
+    return np.exp(np.sum((X - x0) ** 2, axis=-1) / (-2 * sigma * sigma))
 
 
 def gaussian(sigma):
     f = 1 / (math.sqrt(2*math.pi) * sigma)
 
     def kernel(x, X):
-        return f * np.exp(np.sum((X - x) ** 2, axis=1) / (-2 * sigma * sigma))
+        return f * np.exp(np.sum((X - x) ** 2, axis=-1) / (-2 * sigma * sigma))
+    kernel.sigma = sigma
     return kernel
 
 
 GAUSSIAN = gaussian(SIGMA)
 
 
-def lowess(X, Y, kernel=GAUSSIAN):
-    # add bias term
-    X = np.c_[np.ones(len(X)), X]
+def kernel_weights(kernel, S, X):
+    """Kernel weights of the samples X for each of the query points S, shape (len(S), len(X))"""
+    W = kernel(S[:, None, :], X)
+    if np.shape(W) != (len(S), len(X)):
+        # the kernel doesn't broadcast
+        W = np.array([kernel(s, X) for s in S]).reshape(len(S), len(X))
+    return W
+
 
+def lowess(X, Y, kernel=GAUSSIAN):
     def f(x):
-        x = np.r_[1, x]
-        # fit model: normal equations with kernel
-        xw = X.T * kernel(x, X)
-        beta = np.linalg.pinv(xw @ X) @ xw @ Y
-        # predict value
-        return x @ beta
+        return sample_lowess(np.atleast_1d(x)[None, :], X, Y, kernel)[0]
     return f
 
 
-def sample_lowess(S, X, Y, kernel=GAUSSIAN):
-    f = lowess(X, Y, kernel)
-    return np.array([f(s) for s in S])
-
+def local_fits(S, X, Y, kernel=GAUSSIAN, chunk=CHUNK):
+    """Solve the local weighted regressions of Y on X at all the query points S.
 
-def inverse_lowess(X, Y, S=None, kernel=GAUSSIAN, n=N):
+    The weighted normal equations of a block of query points are assembled with two matrix products and solved
+    with a single batched pseudo inverse. Returns the coefficients (bias first), shape (len(S), 1+dims(X), dims(Y))
+    """
+    # add bias term
+    X = np.c_[np.ones(len(X)), X]
+    S = np.c_[np.ones(len(S)), S]
+    Y = np.asarray(Y)
+    n, k = X.shape
+    Yn = Y.reshape(n, -1)
+    m = Yn.shape[1]
+
+    # per sample outer products, so that X^T W X and X^T W Y are matrix products with the weights
+    XX = (X[:, :, None] * X[:, None, :]).reshape(n, k * k)
+    XY = (X[:, :, None] * Yn[:, None, :]).reshape(n, k * m)
+
+    beta = np.empty((len(S), k, m))
+    step = max(1, chunk // max(n, 1))
+    for first in range(0, len(S), step):
+        W = kernel_weights(kernel, S[first:first+step], X)
+        beta[first:first+step] = np.linalg.pinv((W @ XX).reshape(-1, k, k)) @ (W @ XY).reshape(-1, k, m)
+    return beta
+
+
+def _predict(S, beta, Y):
+    S = np.c_[np.ones(len(S)), S]
+    result = np.einsum('si,sij->sj', S, beta)
+    return result if np.ndim(Y) > 1 else result[:, 0]
+
+
+def sample_lowess(S, X, Y, kernel=GAUSSIAN, chunk=CHUNK):
+    """Evaluate the local weighted regression of Y on X at all the query points S"""
+    return _predict(S, local_fits(S, X, Y, kernel, chunk), Y)
+
+
+def window_lowess(S, X, Y, kernel=GAUSSIAN, tol=TOL, block=256):
+    """Approximate sample_lowess for a 1-D X using a truncated kernel.
+
+    Samples whose weight is below tol relative to the kernel's peak are ignored, i.e. those farther than
+    sigma * sqrt(2 ln(1/tol)) from the query point. With X sorted, the support of each block of (sorted) query
+    points is a contiguous window, so each local fit only sees the samples in its window. This pays off only when
+    sigma is small relative to the range of X: when a window spans all the samples the fits are exact.
+    The kernel must have a sigma attribute (see gaussian).
+    """
+    if not hasattr(kernel, 'sigma'):
+        raise ValueError('window_lowess requires a kernel with a sigma attribute')
+    radius = kernel.sigma * math.sqrt(2 * math.log(1 / tol))
+
+    X = np.asarray(X).reshape(-1)
+    if len(X) == 0 or 2 * radius >= np.ptp(X):
+        return sample_lowess(np.asarray(S).reshape(-1), X, Y, kernel)
+    Y = np.asarray(Y)
+    order = np.argsort(X, kind='stable')
+    X, Y = X[order], Y[order]
+
+    S = np.asarray(S).reshape(-1)
+    s_order = np.argsort(S, kind='stable')
+    lo = np.searchsorted(X, S[s_order] - radius, side='left')
+    hi = np.searchsorted(X, S[s_order] + radius, side='right')
+
+    result = np.empty((len(S),) + Y.shape[1:])
+    for first in range(0, len(S), block):
+        q = s_order[first:first+block]
+        a, b = lo[first], hi[min(first+block, len(S)) - 1]
+        result[q] = sample_lowess(S[q], X[a:b], Y[a:b], kernel)
+    return result
+
+
+def binned_lowess(S, X, Y, kernel=GAUSSIAN, bins=BINS):
+    """Approximate sample_lowess for a 1-D X by interpolation.
+
+    The local regressions are solved exactly on a grid of bins points spanning S and their coefficients are linearly
+    interpolated at each query point, so the curve is exact only at the grid points. The error grows with the grid
+    spacing relative to sigma. The cost is O(bins * len(X)) regardless of the number of query points.
+    """
+    S = np.asarray(S).reshape(-1)
+    if len(S) <= bins:
+        return sample_lowess(S, X, Y, kernel)
+
+    grid = np.linspace(np.amin(S), np.amax(S), bins)
+    beta = local_fits(grid, X, Y, kernel)
+    i = np.clip(np.searchsorted(grid, S, side='right') - 1, 0, bins - 2)
+    t = ((S - grid[i]) / (grid[i+1] - grid[i]))[:, None, None]
+    return _predict(S, (1 - t) * beta[i] + t * beta[i+1], Y)
+
+
+def inverse_lowess(X, Y, S=None, kernel=GAUSSIAN, n=N, method='exact', tol=TOL, bins=BINS):
+    """Local regression of X on Y evaluated at S.
+
+    method: 'exact', or one of the approximations 'window' (truncated kernel, see window_lowess) and
+            'binned' (interpolated fits, see binned_lowess)
+    """
     if S is None:
         S = np.linspace(np.amin(Y), np.amax(Y), n)
-    return sample_lowess(S, Y, X, kernel)  # note swap of X and Y
+    # note swap of X and Y
+    if method == 'window':
+        return window_lowess(S, Y, X, kernel, tol=tol)
+    if method == 'binned':
+        return binned_lowess(S, Y, X, kernel, bins=bins)
+    return sample_lowess(S, Y, X, kernel)
+
 
+def inverse_lowess_std(X, Y, S=None, kernel=GAUSSIAN, n=N, method='exact', tol=TOL, bins=BINS):
+    """Kernel weighted std of X around the inverse regression curve, evaluated at S.
 
-def inverse_lowess_std(X, Y, S=None, kernel=GAUSSIAN, n=N):
+    The residuals require the inverse regression at every sample, which is O(len(Y)^2) with method='exact'.
+    method='window' and method='binned' are sub-quadratic approximations (see inverse_lowess).
+    """
     if S is None:
         S = np.linspace(np.amin(Y), np.amax(Y), n)
     Y1 = np.c_[np.ones(len(Y)), Y]
     S1 = np.c_[np.ones(len(S)), S]
-    W = np.array([kernel(s, Y1) for s in S1])
+    W = kernel_weights(kernel, S1, Y1)
     denom = W.sum(axis=1)
 
-    rho = (inverse_lowess(X, Y, S=Y, kernel=kernel) - X) ** 2
+    rho = (inverse_lowess(X, Y, S=Y, kernel=kernel, method=method, tol=tol, bins=bins) - np.asarray(X)) ** 2
     wr = W @ rho
-    std = np.sqrt(np.c_[[wr[c]/denom for c in list(wr)]])
+    std = np.sqrt(wr / denom[:, None])
 
-    return std.T
+    return std
 
 
-def inverse(X, Y, kernel=GAUSSIAN, S=None, scaler=None):
+def inverse(X, Y, kernel=GAUSSIAN, S=None, scaler=None, method='exact'):
     if S is None:
         S = np.linspace(np.amin(Y), np.amax(Y), N)
     if len(S) < 2:
         return pd.DataFrame(columns=X.columns), pd.DataFrame(columns=X.columns)
 
     line = inverse_lowess(X, Y, S, kernel)
-    std = inverse_lowess_std(X, Y, S, kernel=kernel)
+    std = inverse_lowess_std(X, Y, S, kernel=kernel, method=method)
 
     if scaler is not None:
         line = scaler.inverse_transform(line)
@@ -95,41 +204,28 @@ def inverse(X, Y, kernel=GAUSSIAN, S=None, scaler=None):
 #     return f
 
 
-def def_inverse(bandwidth_factor=0.2):
-    def f(context, node):
-        if hasattr(node, 'data'):
-            partition = node.data
-        else:
-            partition = node
-        if partition.y.size < 2:
-            return []
-
-        sigma = bandwidth_factor * (partition.max() - partition.min())
-        kernel = gaussian(sigma)
-        scaler = node.regulus.pts.scaler
-
-        data_range = context['data_range']
-        S = np.linspace(*data_range, N)
-        S1 = S[(S >= np.amin(partition.y)) & (S <= np.amax(partition.y))]
-        return inverse(partition.x, partition.y, kernel, S1, scaler)
+def def_inverse(bandwidth_factor=0.2, method='exact'):
+    """Inverse regression attribute with the given kernel bandwidth (relative to the partition's range).
 
+    The curves of all the partitions are computed together on the tree's shared grid (see InverseCurves). Add it
+    with add_inverse so that measures such as inv_fitness can use the shared curves too
+    """
+    def f(context, node):
+        partition = node.data if hasattr(node, 'data') else node
+        return partition.regulus.inverse_curves(bandwidth_factor=bandwidth_factor, method=method).frames(partition)
     return f
 
 
+def add_inverse(owner, name='inverse_regression', bandwidth_factor=0.2, method='exact'):
+    """Add an inverse regression attribute (see def_inverse) to owner, with the parameters of its shared curves"""
+    owner.add_attr(def_inverse(bandwidth_factor, method), name=name,
+                   curves=dict(bandwidth_factor=bandwidth_factor, method=method))
+
+
+# the parameters of the shared curves of inverse_regression
+INVERSE_CURVES = dict(bandwidth_factor=0.2)
+
+
 def inverse_regression(context, node):
-    if hasattr(node, 'data'):
-        partition = node.data
-    else:
-        partition = node
-    if partition.y.size < 2:
-        return []
-
-    sigma = 0.2 * (partition.max() - partition.min())
-    kernel = gaussian(sigma)
-    scaler = node.regulus.pts.scaler
-
-    data_range = context['data_range']
-    S = np.linspace(*data_range, N)
-    S1 = S[(S >= np.amin(partition.y)) & (S <= np.amax(partition.y))]
-
-    return inverse(partition.x, partition.y, kernel, S1, scaler )
\ No newline at end of file
+    partition = node.data if hasattr(node, 'data') else node
+    return partition.regulus.inverse_curves(**INVERSE_CURVES).frames(partition)
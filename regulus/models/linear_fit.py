@@ -0,0 +1,29 @@
+import numpy as np
+from .moments import design, scatter, solve, r2
+
+
+class LinearFit(object):
+    """A fitted linear model, y = design(x) @ coef_ + intercept_, where the design is x itself for degree 1
+    and x with all its pairwise products for degree 2 (a quadratic model).
+
+    Provides the fit/predict/score interface of a sklearn regressor without the estimator's overhead.
+    """
+
+    def __init__(self, coef=(), intercept=0.0, alpha=0, degree=1):
+        self.coef_ = np.asarray(coef)
+        self.intercept_ = intercept
+        self.alpha = alpha
+        self.degree = degree
+
+    def fit(self, x, y):
+        n, mean, s = scatter(np.c_[design(np.asarray(x), self.degree), np.asarray(y)])
+        self.coef_ = solve(s, self.alpha)
+        self.intercept_ = mean[-1] - self.coef_ @ mean[:-1]
+        return self
+
+    def predict(self, x):
+        return design(np.asarray(x), self.degree) @ self.coef_ + self.intercept_
+
+    def score(self, x, y):
+        n, mean, s = scatter(np.c_[design(np.asarray(x), self.degree), np.asarray(y)])
+        return float(r2(n, mean, s, self.coef_, self.intercept_))
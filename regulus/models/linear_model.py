@@ -1,4 +1,5 @@
 from .null_model import NullModel
+from .linear_fit import LinearFit
 from sklearn import linear_model as lm
 
 
@@ -42,3 +43,34 @@ def dim_model(context, node):
 
     models = [lm.Ridge().fit(partition.x[[d]], partition.y) for d in partition.x.columns]
     return models
+
+
+def _batch_fit(partition, alpha):
+    moments = partition.regulus.moments
+    if moments.of(partition)[0] < 2:
+        return NullModel()
+    coef, intercept, _ = moments.fit_partition(partition, alpha)
+    return LinearFit(coef, intercept, alpha=alpha)
+
+
+def batch_linear_model(context, node):
+    """Same as linear_model but computed from the tree's sufficient statistics"""
+    return _batch_fit(node.data, alpha=0)
+
+
+def batch_ridge_model(context, node):
+    """Same as ridge_model but computed from the tree's sufficient statistics"""
+    if node.id < 0:
+        return NullModel()
+    return _batch_fit(node.data, alpha=1.0)
+
+
+def batch_dim_model(context, node):
+    """Same as dim_model but computed, for all the dimensions at once, from the tree's sufficient statistics"""
+    partition = node.data
+    moments = partition.regulus.moments
+    if moments.of(partition)[0] < 2:
+        return [NullModel() for _ in range(moments.dims)]
+
+    coef, intercept, _ = moments.dim_fit_partition(partition, alpha=1.0)
+    return [LinearFit([c], b, alpha=1.0) for c, b in zip(coef, intercept)]
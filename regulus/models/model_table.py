@@ -0,0 +1,173 @@
+from collections.abc import MutableMapping
+import numpy as np
+from sklearn import linear_model as lm
+from sklearn.preprocessing import PolynomialFeatures
+
+from .linear_fit import LinearFit
+from .null_model import NullModel
+
+# sklearn regressors whose predict is x @ coef_ + intercept_. GLMs (PoissonRegressor, GammaRegressor, ...) have a
+# coef_ too, but predict through a link function
+LINEAR = (lm.LinearRegression, lm.Ridge, lm.RidgeCV, lm.Lasso, lm.LassoCV, lm.ElasticNet, lm.ElasticNetCV,
+          lm.Lars, lm.LarsCV, lm.LassoLars, lm.LassoLarsCV, lm.LassoLarsIC, lm.BayesianRidge, lm.ARDRegression,
+          lm.HuberRegressor, lm.TheilSenRegressor, lm.OrthogonalMatchingPursuit)
+
+
+def _linear(regressor):
+    return type(regressor) in LINEAR and np.ndim(regressor.coef_) == 1
+
+
+def compact(model):
+    """Convert a (linear) model to a LinearFit. Returns None if the model can't be represented as one.
+
+    Supports LinearFit, NullModel, the sklearn regressors of LINEAR and the
+    make_pipeline(PolynomialFeatures(2), LinearRegression()) pipelines of quadratic_model
+    """
+    if isinstance(model, (LinearFit, NullModel)):
+        return model
+    steps = getattr(model, 'steps', None)
+    if steps is not None:
+        if len(steps) != 2 or not _linear(steps[1][1]):
+            return None
+        features, regressor = steps[0][1], steps[1][1]
+        if type(features) is not PolynomialFeatures or features.degree != 2 or features.interaction_only:
+            return None
+        coef = np.asarray(regressor.coef_, dtype=float)
+        intercept = float(regressor.intercept_)
+        if features.include_bias:
+            intercept += coef[0]
+            coef = coef[1:]
+        return LinearFit(coef, intercept, degree=2)
+    if not _linear(model):
+        return None
+    return LinearFit(model.coef_, float(model.intercept_), alpha=getattr(model, 'alpha', 0))
+
+
+class ModelTable(MutableMapping):
+    """The models of an attribute, one (or a list of models) per key, stored as dense arrays.
+
+    coef has shape (n, k, p) and intercept, alpha and null (NullModel entries) shape (n, k), where k is the number of
+    models per entry (e.g. one per dimension for dim_model). Entries are returned as LinearFit/NullModel objects
+    that are created on demand. ModelTable is a mapping so it can serve as a Cache's storage; entries assigned after
+    the table was built are kept aside, as is, until the table is rebuilt.
+    """
+
+    def __init__(self, keys, coef, intercept, alpha, null, degree=1, lists=False):
+        self.keys_ = list(keys)
+        self.index = {key: i for i, key in enumerate(self.keys_)}
+        self.coef = coef
+        self.intercept = intercept
+        self.alpha = alpha
+        self.null = null
+        self.degree = degree
+        self.lists = lists
+        self.extra = {}
+
+    @staticmethod
+    def from_items(items):
+        """Build a table from (key, model) or (key, list of models) pairs. Returns None if they can't be tabulated"""
+        keys, entries = [], []
+        lists = None
+        for key, value in items:
+            is_list = isinstance(value, (list, tuple))
+            if lists is None:
+                lists = is_list
+            if is_list != lists:
+                return None
+            models = [compact(m) for m in (value if is_list else [value])]
+            if any(m is None for m in models):
+                return None
+            keys.append(key)
+            entries.append(models)
+        if len(keys) == 0 or len(set(map(len, entries))) != 1:
+            return None
+
+        fits = [m for models in entries for m in models if isinstance(m, LinearFit)]
+        if len({m.degree for m in fits}) > 1 or len({m.coef_.shape for m in fits}) > 1:
+            return None
+        degree = fits[0].degree if fits else 1
+        p = fits[0].coef_.shape[0] if fits else 0
+
+        n, k = len(entries), len(entries[0])
+        coef = np.zeros((n, k, p))
+        intercept = np.zeros((n, k))
+        alpha = np.zeros((n, k))
+        null = np.zeros((n, k), dtype=bool)
+        for i, models in enumerate(entries):
+            for j, m in enumerate(models):
+                if isinstance(m, NullModel):
+                    null[i, j] = True
+                else:
+                    coef[i, j], intercept[i, j], alpha[i, j] = m.coef_, m.intercept_, m.alpha
+        return ModelTable(keys, coef, intercept, alpha, null, degree=degree, lists=lists)
+
+    def _model(self, i, j):
+        if self.null[i, j]:
+            return NullModel()
+        return LinearFit(self.coef[i, j], self.intercept[i, j], alpha=self.alpha[i, j], degree=self.degree)
+
+    def __getitem__(self, key):
+        if key in self.extra:
+            return self.extra[key]
+        i = self.index[key]
+        if self.lists:
+            return [self._model(i, j) for j in range(self.coef.shape[1])]
+        return self._model(i, 0)
+
+    def __setitem__(self, key, value):
+        self.extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self.extra:
+            del self.extra[key]
+        else:
+            del self.index[key]
+            self.keys_.remove(key)
+
+    def __contains__(self, key):
+        return key in self.extra or key in self.index
+
+    def __iter__(self):
+        yield from (key for key in self.keys_ if key not in self.extra)
+        yield from self.extra
+
+    def __len__(self):
+        return len(self.index) + sum(1 for key in self.extra if key not in self.index)
+
+    def rows(self, keys):
+        return np.array([self.index[key] for key in keys], dtype=int)
+
+    def predict(self, x, keys=None):
+        """Predictions of the models of keys (default all) at the points x.
+
+        Returns an array of shape (len(keys), len(x)), or (len(keys), k, len(x)) for tables of lists. NullModel
+        entries predict NaN.
+        """
+        from .moments import design
+        rows = self.rows(keys) if keys is not None else np.arange(len(self.keys_))
+        values = np.einsum('ikp,mp->ikm', self.coef[rows], design(np.asarray(x), self.degree)) \
+            + self.intercept[rows][..., None]
+        values[self.null[rows]] = np.nan
+        return values if self.lists else values[:, 0]
+
+
+def tabulate(values):
+    """The values (of a cache) as a ModelTable if they are all (linear) models, or None. values is not changed"""
+    if isinstance(values, ModelTable) and len(values.extra) == 0:
+        return values
+    return ModelTable.from_items(values.items()) if len(values) > 0 else None
+
+
+def compact_cache(cache):
+    """Store the cache's values in a ModelTable if they are all (linear) models. Returns True if they are"""
+    table = tabulate(cache.cache)
+    if table is not None:
+        cache.cache = table
+    return table is not None
+
+
+def compact_models(has_attrs):
+    """Store every attribute of has_attrs whose values are all (linear) models in a ModelTable"""
+    for name, cache in list(has_attrs.attr.cache.items()):
+        if getattr(cache, 'cache', None) is not None:
+            compact_cache(cache)
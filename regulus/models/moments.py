@@ -0,0 +1,306 @@
+from functools import reduce
+import numpy as np
+
+from regulus.tree.traverse import depth_first
+
+# max number of values in the temporary arrays of a batched computation
+CHUNK = 2**22
+# largest total size, in bytes, of the scatter matrices kept by default
+MAX_SCATTER = 2**28
+
+
+def scatter(z):
+    """Count, mean and centered co-moment (scatter) matrix of the rows of z.
+
+    The product over the points is done in z's precision (e.g. float32); the statistics are returned as float64
+    """
+    n = len(z)
+    if n == 0:
+        k = z.shape[1]
+        return 0, np.zeros(k), np.zeros((k, k))
+    if z.dtype == np.float64:
+        mean = z.mean(axis=0)
+        c = z - mean
+        return n, mean, c.T @ c
+    # center on the rounded mean and correct for the rounding
+    mean = z.mean(axis=0, dtype=np.float64)
+    c = z - mean.astype(z.dtype)
+    delta = c.mean(axis=0, dtype=np.float64)
+    return n, mean, (c.T @ c).astype(np.float64) - n * np.outer(delta, delta)
+
+
+def merge(a, b):
+    """Combine the statistics of two disjoint sets of points"""
+    n1, m1, s1 = a
+    n2, m2, s2 = b
+    if n1 == 0:
+        return b
+    if n2 == 0:
+        return a
+    n = n1 + n2
+    delta = m2 - m1
+    return n, m1 + delta * (n2 / n), s1 + s2 + np.outer(delta, delta) * (n1 * n2 / n)
+
+
+def solve(scatter, alpha=0):
+    """Fit y ~ x from stacked scatter matrices of [x, y].
+
+    alpha=0 gives the (minimum norm) least squares solution, alpha > 0 a ridge regression.
+    Returns the coefficients, shape (..., d), for centered data.
+    """
+    d = scatter.shape[-1] - 1
+    sxx = scatter[..., :d, :d]
+    sxy = scatter[..., :d, d:]
+    if alpha > 0:
+        coef = np.linalg.solve(sxx + alpha * np.eye(d), sxy)
+    else:
+        coef = np.linalg.pinv(sxx, rcond=1e-13, hermitian=True) @ sxy
+    return coef[..., 0]
+
+
+def r2(count, mean, scatter, coef, intercept):
+    """R^2 of the models (coef, intercept) on the point sets described by (count, mean, scatter).
+
+    All arguments are stacked along the leading dimension, so each model is scored on its own point set.
+    """
+    d = scatter.shape[-1] - 1
+    sxx = scatter[..., :d, :d]
+    sxy = scatter[..., :d, d]
+    syy = scatter[..., d, d]
+    bias = mean[..., d] - np.einsum('...i,...i->...', coef, mean[..., :d]) - intercept
+    ss_res = syy \
+        - 2 * np.einsum('...i,...i->...', coef, sxy) \
+        + np.einsum('...i,...ij,...j->...', coef, sxx, coef) \
+        + count * bias * bias
+    return _r2(ss_res, syy)
+
+
+def solve_dims(scatter, alpha=1.0):
+    """Fit y ~ x[j] separately for each dimension j. Returns the slopes, shape (..., d), for centered data"""
+    d = scatter.shape[-1] - 1
+    sxx = np.diagonal(scatter[..., :d, :d], axis1=-2, axis2=-1) + alpha
+    sxy = scatter[..., :d, d]
+    return np.divide(sxy, sxx, out=np.zeros_like(sxy), where=sxx > 0)
+
+
+def r2_dims(count, mean, scatter, coef, intercept):
+    """R^2 of univariate models, y ~ coef[..., j] * x[j] + intercept[..., j], for each dimension j"""
+    d = scatter.shape[-1] - 1
+    sxx = np.diagonal(scatter[..., :d, :d], axis1=-2, axis2=-1)
+    sxy = scatter[..., :d, d]
+    syy = scatter[..., d, d][..., None]
+    bias = mean[..., d:] - coef * mean[..., :d] - intercept
+    ss_res = syy - 2 * coef * sxy + coef * coef * sxx + np.asarray(count)[..., None] * bias * bias
+    return _r2(ss_res, syy)
+
+
+def stepwise_r2(scatter, order, tol=1e-10):
+    """R^2 of the least squares fits of y on growing prefixes of the dimensions.
+
+    scatter is a stack of (d+1, d+1) scatter matrices of [x, y] and order, shape (..., d), the order in which the
+    dimensions enter the fit. A Cholesky factorization of the reordered x scatter matrix is built one column at a time,
+    and the forward substitution of x^T y along with it, so that all d prefix fits cost about one fit. A dimension
+    that is (numerically) a combination of the previous ones adds nothing to the fit.
+    Returns the R^2 of each prefix, shape (..., d)
+    """
+    d = scatter.shape[-1] - 1
+    order = np.asarray(order)
+    sxx = np.take_along_axis(np.take_along_axis(scatter[..., :d, :d], order[..., :, None], -2), order[..., None, :], -1)
+    sxy = np.take_along_axis(scatter[..., :d, d], order, -1)
+    syy = scatter[..., d, d]
+
+    L = np.zeros(sxx.shape)
+    z = np.zeros(sxy.shape)
+    for k in range(d):
+        v = sxx[..., k:, k] - np.einsum('...ij,...j->...i', L[..., k:, :k], L[..., k, :k])
+        pivot = v[..., 0]
+        ok = pivot > tol * np.maximum(sxx[..., k, k], np.finfo(float).tiny)
+        root = np.sqrt(np.where(ok, pivot, 1))
+        L[..., k:, k] = np.where(ok[..., None], v / root[..., None], 0)
+        z[..., k] = np.where(ok, (sxy[..., k] - np.einsum('...j,...j->...', L[..., k, :k], z[..., :k])) / root, 0)
+
+    ss_res = syy[..., None] - np.cumsum(z * z, axis=-1)
+    return _r2(ss_res, syy[..., None])
+
+
+def _r2(ss_res, ss_tot):
+    ss_res = np.maximum(ss_res, 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        score = 1 - ss_res / ss_tot
+    # follow sklearn's r2_score for a constant y
+    return np.where(ss_tot > 0, score, np.where(ss_res > 0, 0.0, 1.0))
+
+
+def design(x, degree=1):
+    """Design matrix of a polynomial model without the bias column, in the column order of sklearn's
+    PolynomialFeatures: x, then x_i * x_j for i <= j (degree=2)"""
+    if degree == 1:
+        return x
+    if degree == 2:
+        i, j = np.triu_indices(x.shape[1])
+        return np.c_[x, x[:, i] * x[:, j]]
+    raise ValueError(f'unsupported degree {degree}')
+
+
+class Moments(object):
+    """Per-partition sufficient statistics of the joint [design(x), y] data.
+
+    For every partition we keep the number of points, their mean and their scatter matrix. A parent's
+    statistics are accumulated from its children's spans plus its own extrema, so the data is scanned once
+    for the whole tree. Linear and ridge fits, and their R^2, then reduce to small d x d solves.
+
+    For degree 2 each row of the design is expanded once, while scanning the partitions in span order, and only
+    chunk values of it exist at any time. The (p+1)^2 scatter matrices of all partitions may still be too large
+    for a big d. With keep=False only the fits (for the given alpha) are kept: each partition is solved as soon
+    as its statistics are complete and its scatter matrix is dropped once its parent has absorbed it.
+    keep=None decides based on MAX_SCATTER.
+    """
+
+    def __init__(self, regulus, ids, count, mean, scatter, degree=1, fits=None):
+        self.regulus = regulus
+        self.index = {id_: i for i, id_ in enumerate(ids)}
+        self.count = count
+        self.mean = mean
+        self.scatter = scatter
+        self.degree = degree
+        self._fits = fits if fits is not None else {}
+        # statistics of the partitions that are not part of the tree, by their points
+        self._other = {}
+
+    @staticmethod
+    def from_regulus(regulus, degree=1, keep=None, alpha=0, chunk=CHUNK):
+        x = regulus.x.values
+        y = regulus.y.values
+        loc = np.asarray(regulus.pts_loc, dtype=int)
+        d = design(x[:1], degree).shape[1] + 1
+        if keep is None:
+            keep = regulus.tree.size() * d * d * 8 <= MAX_SCATTER
+        rows = max(1, chunk // d)
+
+        def stats(idx):
+            s = scatter(np.empty((0, d)))
+            for first in range(0, len(idx), rows):
+                part = idx[first:first+rows]
+                s = merge(s, scatter(np.c_[design(x[part], degree), y[part]]))
+            return s
+
+        span_stats = {}
+        ids, partitions = [], []
+        for node in depth_first(regulus.tree.root, post=True):
+            partition = node.data
+            first, last = partition.pts_span
+            children = [span_stats.pop(child) for child in node.children]
+            if children and sum(c[0] for c in children) == last - first:
+                s = reduce(merge, children)
+            else:
+                s = stats(loc[first:last])
+            span_stats[node] = s
+
+            if partition.id >= 0:
+                n, mean, s = merge(s, stats(np.asarray(partition.extrema, dtype=int)))
+                if not keep:
+                    coef = solve(s, alpha)
+                    intercept = mean[-1] - coef @ mean[:-1]
+                    s = (coef, intercept, r2(n, mean, s, coef, intercept))
+                ids.append(partition.id)
+                partitions.append((n, mean, s))
+
+        count = np.array([p[0] for p in partitions], dtype=int)
+        mean = np.array([p[1] for p in partitions]).reshape(-1, d)
+        if keep:
+            scatter_ = np.array([p[2] for p in partitions]).reshape(-1, d, d)
+            return Moments(regulus, ids, count, mean, scatter_, degree=degree)
+
+        fits = {alpha: (np.array([p[2][0] for p in partitions]).reshape(-1, d - 1),
+                        np.array([p[2][1] for p in partitions]),
+                        np.array([p[2][2] for p in partitions]))}
+        return Moments(regulus, ids, count, mean, None, degree=degree, fits=fits)
+
+    @property
+    def dims(self):
+        return self.mean.shape[1] - 1
+
+    def row(self, partition):
+        return self.index.get(partition.id, None) if partition.id >= 0 else None
+
+    def of(self, partition):
+        """(count, mean, scatter) of a partition. Partitions that are not part of the tree are computed directly.
+
+        The scatter is None if the scatter matrices were not kept. The statistics of other partitions are computed
+        once and kept.
+        """
+        row = self.row(partition)
+        if row is not None:
+            return self.count[row], self.mean[row], self.scatter[row] if self.scatter is not None else None
+        key = (partition.id, tuple(partition.pts_span), tuple(partition.extrema))
+        if key not in self._other:
+            idx = np.asarray(partition.idx, dtype=int)
+            x, y = self.regulus.x.values[idx], self.regulus.y.values[idx]
+            self._other[key] = scatter(np.c_[design(x, self.degree), y])
+        return self._other[key]
+
+    def fit(self, alpha=0):
+        """Least squares (alpha=0) or ridge fits for all the partitions.
+
+        Returns the coefficients (n, d), intercepts (n,) and the R^2 of each fit on its own partition (n,)
+        """
+        if alpha not in self._fits:
+            if self.scatter is None:
+                raise ValueError(f'fits for alpha={alpha} were not computed and the scatter matrices were not kept')
+            d = self.dims
+            # solve in blocks to bound the memory of the batched solves
+            step = max(1, CHUNK // (d + 1) ** 2)
+            coef = np.concatenate([solve(self.scatter[first:first+step], alpha)
+                                   for first in range(0, len(self.scatter), step)]).reshape(-1, d)
+            intercept = self.mean[:, d] - np.einsum('ij,ij->i', coef, self.mean[:, :d])
+            score = r2(self.count, self.mean, self.scatter, coef, intercept)
+            self._fits[alpha] = coef, intercept, score
+        return self._fits[alpha]
+
+    def fit_partition(self, partition, alpha=0):
+        """Coefficients, intercept and R^2 of a single partition"""
+        row = self.row(partition)
+        if row is not None:
+            coef, intercept, score = self.fit(alpha)
+            return coef[row], intercept[row], score[row]
+
+        n, mean, s = self.of(partition)
+        d = self.dims
+        coef = solve(s, alpha)
+        intercept = mean[d] - coef @ mean[:d]
+        return coef, intercept, r2(n, mean, s, coef, intercept)
+
+    def cross_score(self, coef, intercept, rows):
+        """R^2 of a batch of linear models on the points of other partitions, in closed form.
+
+        coef (k, d) and intercept (k,) describe k models; model i is scored on the partition at rows[i].
+        """
+        rows = np.asarray(rows, dtype=int)
+        return r2(self.count[rows], self.mean[rows], self.scatter[rows], coef, intercept)
+
+    def dim_fit(self, alpha=1.0):
+        """Univariate ridge fits of y on each dimension separately, for all the partitions.
+
+        Returns the slopes, intercepts and R^2 on the partition itself, each of shape (n, d)
+        """
+        key = ('dims', alpha)
+        if key not in self._fits:
+            d = self.dims
+            coef = solve_dims(self.scatter, alpha)
+            intercept = self.mean[:, d:] - coef * self.mean[:, :d]
+            score = r2_dims(self.count, self.mean, self.scatter, coef, intercept)
+            self._fits[key] = coef, intercept, score
+        return self._fits[key]
+
+    def dim_fit_partition(self, partition, alpha=1.0):
+        """Slopes, intercepts and R^2 of the univariate fits of a single partition"""
+        row = self.row(partition)
+        if row is not None:
+            coef, intercept, score = self.dim_fit(alpha)
+            return coef[row], intercept[row], score[row]
+
+        n, mean, s = self.of(partition)
+        d = self.dims
+        coef = solve_dims(s, alpha)
+        intercept = mean[d:] - coef * mean[:d]
+        return coef, intercept, r2_dims(n, mean, s, coef, intercept)
@@ -0,0 +1,100 @@
+import numpy as np
+
+from .linear_fit import LinearFit
+from .moments import CHUNK, design, _r2
+from .null_model import NullModel
+
+
+class Predictions(object):
+    """Predictions of a model attribute's models, each on its own partition's points, kept in one array.
+
+    The points of all the partitions are laid out in span order (a partition's span followed by its extrema, as in
+    Partition.idx). The entries of the partition at row i are values[offsets[i]:offsets[i+1]], with the matching
+    data points idx[...] and measure y[...]. Linear fits are evaluated for all partitions together; other models
+    are asked to predict their own partition. Partitions without a model (NullModel or None) are NaN.
+    """
+
+    def __init__(self, regulus, name, chunk=CHUNK):
+        self.regulus = regulus
+        self.name = name
+        self.index = {}
+        self.offsets = None
+        self.idx = None
+        self.y = None
+        self.values = None
+        self._scores = None
+        self._compute(chunk)
+
+    def _compute(self, chunk):
+        regulus = self.regulus
+        models = regulus.attr[self.name]
+        loc = np.asarray(regulus.pts_loc, dtype=int)
+        nodes = [node for node in regulus.tree if node.id >= 0]
+
+        self.index = {node.id: i for i, node in enumerate(nodes)}
+        parts = [np.r_[loc[slice(*node.data.pts_span)], np.asarray(node.data.extrema, dtype=int)] for node in nodes]
+        sizes = np.array([len(p) for p in parts], dtype=int)
+        self.offsets = np.r_[0, np.cumsum(sizes)]
+        self.idx = np.concatenate(parts) if parts else np.zeros(0, dtype=int)
+        self.y = regulus.y.values[self.idx]
+        self.values = np.full(len(self.idx), np.nan)
+
+        x = regulus.x.values
+        fits = {}
+        for i, node in enumerate(nodes):
+            model = models[node]
+            if model is None or isinstance(model, NullModel) or sizes[i] == 0:
+                continue
+            if isinstance(model, LinearFit):
+                fits.setdefault(model.degree, []).append((i, model))
+            else:
+                first, last = self.offsets[i], self.offsets[i+1]
+                self.values[first:last] = np.ravel(model.predict(regulus.x.loc[self.idx[first:last]]))
+
+        for degree, group in fits.items():
+            rows = np.array([i for i, _ in group])
+            coef = np.array([m.coef_ for _, m in group])
+            intercept = np.array([m.intercept_ for _, m in group])
+            pos = np.concatenate([np.arange(self.offsets[i], self.offsets[i+1]) for i in rows])
+            which = np.repeat(np.arange(len(rows)), sizes[rows])
+            step = max(1, chunk // coef.shape[1])
+            for first in range(0, len(pos), step):
+                p, w = pos[first:first+step], which[first:first+step]
+                self.values[p] = np.einsum('ij,ij->i', design(x[self.idx[p]], degree), coef[w]) + intercept[w]
+
+    def row(self, partition):
+        return self.index.get(partition.id, None) if partition.id >= 0 else None
+
+    def _slice(self, partition):
+        row = self.row(partition)
+        if row is None:
+            return None
+        return slice(self.offsets[row], self.offsets[row+1])
+
+    def of(self, partition):
+        """The predictions of the partition's model at the partition's points, or None if it isn't in the tree"""
+        s = self._slice(partition)
+        return self.values[s] if s is not None else None
+
+    def residuals(self, partition):
+        """y - prediction at the partition's points, or None if the partition isn't in the tree"""
+        s = self._slice(partition)
+        return self.y[s] - self.values[s] if s is not None else None
+
+    def scores(self, rows=None):
+        """R^2 of the models on their own partitions (NaN for partitions without a model)"""
+        if self._scores is None:
+            n = len(self.offsets) - 1
+            sizes = np.diff(self.offsets)
+            segment = np.repeat(np.arange(n), sizes)
+            mean = np.bincount(segment, self.y, minlength=n) / np.maximum(sizes, 1)
+            ss_tot = np.bincount(segment, (self.y - mean[segment]) ** 2, minlength=n)
+            ss_res = np.bincount(segment, (self.y - self.values) ** 2, minlength=n)
+            self._scores = np.where(np.isnan(ss_res), np.nan, _r2(ss_res, ss_tot))
+        return self._scores if rows is None else self._scores[np.asarray(rows, dtype=int)]
+
+    def score(self, partition):
+        row = self.row(partition)
+        if row is None:
+            return None
+        return float(self.scores([row])[0])
@@ -1,4 +1,5 @@
 from .null_model import NullModel
+from .linear_fit import LinearFit
 from sklearn.linear_model import  LinearRegression, Ridge
 from sklearn.preprocessing import PolynomialFeatures
 from sklearn.pipeline import make_pipeline
@@ -12,3 +13,13 @@ def quadratic_model(context, node):
                           LinearRegression())
     model.fit(partition.x, partition.y)
     return model
+
+
+def batch_quadratic_model(context, node):
+    """Same as quadratic_model but computed from the tree's sufficient statistics of the degree 2 design"""
+    partition = node.data
+    moments = partition.regulus.design_moments(degree=2)
+    if moments.of(partition)[0] < 2:
+        return NullModel()
+    coef, intercept, _ = moments.fit_partition(partition)
+    return LinearFit(coef, intercept, degree=2)
@@ -1,3 +1,5 @@
 from .regulus import *
-from .morse import morse, morse_smale, msc
+from .morse import morse, morse_smale, msc, msc_many
+from .graph import Graph, CachedGraph, KnnGraph
 from .alg import *
+from .sweep import sweep
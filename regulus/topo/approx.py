@@ -0,0 +1,131 @@
+"""Approximate Morse-Smale Complexes, built on a subsample of the points.
+
+The complex of the subsample gives the extrema, the base partitions and the hierarchy. Each of the other points
+takes one step of steepest ascent (and of descent) to one of its nearest sample points and joins the flow of that
+point: its maximum (minimum) is the sample point's. msc(..., sample=...) builds a Regulus of all the points this
+way, and agreement() compares it with the exact one.
+"""
+import numpy as np
+
+SAMPLING = ('random', 'farthest')
+POOL = 20
+BATCH = 2**16
+
+
+def subsample(x, size, method='random', seed=None, pool=POOL):
+    """The (sorted) indices of a sample of size points of x, or of a fraction of them if size is a float.
+
+    'random' is a uniform sample. 'farthest' is a farthest point sample (each point is the farthest one from those
+    already taken) of a random pool of pool*size points, which covers x evenly
+    """
+    n = len(x)
+    if not np.isscalar(size):
+        return np.unique(np.asarray(size, dtype=int))
+    size = int(round(size * n)) if isinstance(size, float) else int(size)
+    if size >= n:
+        return np.arange(n)
+    rng = np.random.default_rng(seed)
+    if method == 'random':
+        return np.sort(rng.choice(n, size, replace=False))
+    if method == 'farthest':
+        candidates = np.sort(rng.choice(n, min(n, pool * size), replace=False))
+        return np.sort(candidates[farthest_points(x[candidates], size, rng)])
+    raise ValueError(f'unknown sampling {method}. Known: {list(SAMPLING)}')
+
+
+def farthest_points(x, size, rng=None):
+    """Indices of size points of x, each the farthest from the ones before it (the first is random)"""
+    rng = rng if rng is not None else np.random.default_rng()
+    taken = np.empty(size, dtype=int)
+    taken[0] = rng.integers(len(x))
+    dist = np.sum((x - x[taken[0]])**2, axis=1)
+    for i in range(1, size):
+        taken[i] = np.argmax(dist)
+        np.minimum(dist, np.sum((x - x[taken[i]])**2, axis=1), out=dist)
+    return taken
+
+
+def flow_of(base, n):
+    """The minimum and the maximum of each of n points, given the base partitions {(min, max): points}"""
+    keys = np.array(list(base.keys()), dtype=int).reshape(-1, 2)
+    sizes = [len(pts) for pts in base.values()]
+    pts = np.concatenate([np.asarray(p, dtype=int) for p in base.values()]) if sizes else np.zeros(0, dtype=int)
+    lo, hi = np.full(n, -1), np.full(n, -1)
+    lo[pts], hi[pts] = np.repeat(keys[:, 0], sizes), np.repeat(keys[:, 1], sizes)
+    return lo, hi
+
+
+def assign(x, y, sample, base, knn=8, batch=BATCH):
+    """The base partitions of all the points, given those of the sample points.
+
+    x (normalized, as the graph sees it) and y are of all the points, sample the indices of the sample points and
+    base the sample's base partitions, {(min, max): points} in indices of all the points. The other points are
+    assigned in batches: a point's maximum is that of its steepest ascending neighbor among its knn nearest
+    sample points (its minimum that of the steepest descending one), or that of its nearest sample point if it
+    has no higher (lower) one or if the sample has no partition of that minimum and maximum.
+    """
+    from scipy.spatial import cKDTree
+    n = len(x)
+    lo, hi = flow_of(base, n)
+    sample_lo, sample_hi = lo[sample], hi[sample]
+    known = np.unique(np.array(list(base.keys()), dtype=np.int64).reshape(-1, 2) @ np.array([n, 1]))
+
+    rest = np.setdiff1d(np.arange(n), sample)
+    tree = cKDTree(x[sample])
+    k = min(knn, len(sample))
+    ys = y[sample]
+    for first in range(0, len(rest), batch):
+        pts = rest[first:first+batch]
+        d, nbrs = tree.query(x[pts], k=k, workers=-1)
+        d, nbrs = d.reshape(len(pts), k), nbrs.reshape(len(pts), k)
+        diff = ys[nbrs] - y[pts][:, None]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = np.where(d > 0, diff / np.where(d > 0, d, 1), np.sign(diff) * np.inf)
+        rows = np.arange(len(pts))
+        up, down = np.argmax(slope, axis=1), np.argmin(slope, axis=1)
+        up = np.where(slope[rows, up] > 0, nbrs[rows, up], nbrs[:, 0])
+        down = np.where(slope[rows, down] < 0, nbrs[rows, down], nbrs[:, 0])
+        p_lo, p_hi = sample_lo[down], sample_hi[up]
+        missing = ~np.isin(p_lo.astype(np.int64) * n + p_hi, known)
+        p_lo[missing], p_hi[missing] = sample_lo[nbrs[missing, 0]], sample_hi[nbrs[missing, 0]]
+        lo[pts], hi[pts] = p_lo, p_hi
+
+    code = lo.astype(np.int64) * n + hi
+    order = np.argsort(code, kind='stable')
+    codes, starts = np.unique(code[order], return_index=True)
+    return {(int(c // n), int(c % n)): pts for c, pts in zip(codes, np.split(order, starts[1:]))}
+
+
+def extend(topo, sample, x, y, knn=8, batch=BATCH):
+    """The base partitions and merge sequence of all the points, from the complex (topo) of the sample"""
+    base = {(int(sample[lo]), int(sample[hi])): sample[np.asarray(pts, dtype=int)]
+            for (lo, hi), pts in topo.base_partitions.items()}
+    hierarchy = {int(sample[key]): (record[0], int(sample[record[1]])) + tuple(int(sample[i]) for i in record[2:])
+                 for key, record in topo.get_merge_sequence().items()}
+    return assign(x, y, sample, base, knn, batch), hierarchy
+
+
+def labels(regulus, level=0):
+    """The partition of each point at a persistence level (-1 for points in none)"""
+    from regulus.tree.arrays import TreeArrays
+    arrays = TreeArrays(regulus.tree.root)
+    parent = arrays.parent
+    top = (parent < 0) | (arrays.ids[np.maximum(parent, 0)] < 0)
+    alive = (arrays.ids >= 0) & (arrays.persistence <= level) & \
+        (top | (arrays.persistence[np.maximum(parent, 0)] > level))
+    loc = np.asarray(regulus.pts_loc)
+    result = np.full(len(loc), -1)
+    for i in np.flatnonzero(alive):
+        result[loc[arrays.span[i, 0]:arrays.span[i, 1]]] = i
+    return result
+
+
+def agreement(approx, exact, levels=(0, 0.01, 0.05, 0.1, 0.2)):
+    """How close an approximate Regulus is to the exact one: the adjusted Rand index of their partitions of the
+    points at each persistence level, and their numbers of partitions"""
+    from sklearn.metrics import adjusted_rand_score
+    report = dict(partitions=len([n for n in approx.tree if n.id >= 0]),
+                  exact_partitions=len([n for n in exact.tree if n.id >= 0]))
+    for level in levels:
+        report[f'ari_{level:g}'] = adjusted_rand_score(labels(exact, level), labels(approx, level))
+    return report
@@ -0,0 +1,282 @@
+"""Neighborhood graphs for msc.
+
+topopy (>= 1.0) takes a graph object: it calls graph.build(X) and then reads graph.full_graph(), a dict of each
+point's neighbors. Graph implements this protocol over a scipy sparse adjacency matrix, so a graph can be given
+precomputed, stored and reloaded. CachedGraph keeps the graphs built by another graph object on disk.
+
+Besides nglpy's graphs, KnnGraph builds kNN graphs (optionally pruned to a beta skeleton) with scipy's cKDTree
+or sklearn, using all the cores for the queries and numpy for the pruning.
+"""
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
+import scipy.sparse as sp
+
+NGL_GRAPHS = {'beta skeleton': False, 'relaxed beta skeleton': True}
+KNN_GRAPHS = {'knn': False, 'knn beta skeleton': True}
+KNN_BACKENDS = ('kdtree', 'sklearn')
+CHUNK = 2**18
+CACHE_DIR = Path.home() / '.cache' / 'regulus' / 'graphs'
+
+
+def adjacency_of(graph, n):
+    """The adjacency (CSR) matrix of a graph object that has a full_graph() mapping"""
+    full = graph.full_graph()
+    cols = [np.fromiter(full[i] if i in full else (), dtype=np.int64) for i in range(n)]
+    rows = [np.full(len(c), i, dtype=np.int64) for i, c in enumerate(cols)]
+    rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+    cols = np.concatenate(cols) if cols else np.zeros(0, dtype=np.int64)
+    return sp.csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(n, n))
+
+
+class Graph(object):
+    """A neighborhood graph given by its adjacency matrix (anything scipy.sparse.csr_matrix accepts)"""
+
+    def __init__(self, adjacency=None):
+        self.adjacency = sp.csr_matrix(adjacency) if adjacency is not None else None
+
+    def build(self, X):
+        if self.adjacency is None:
+            raise ValueError('Graph has no adjacency matrix')
+        if self.adjacency.shape[0] != len(X):
+            raise ValueError(f'graph of {self.adjacency.shape[0]} points given for {len(X)} points')
+
+    def full_graph(self):
+        indptr, indices = self.adjacency.indptr, self.adjacency.indices
+        return {i: indices[indptr[i]:indptr[i+1]].tolist() for i in range(self.adjacency.shape[0])}
+
+    def neighbors(self, idx=None):
+        if idx is None:
+            return self.full_graph()
+        indptr = self.adjacency.indptr
+        return self.adjacency.indices[indptr[idx]:indptr[idx+1]].tolist()
+
+    def save(self, path):
+        """Save the adjacency to an .npz file, through a temporary file and a rename"""
+        path = Path(path)
+        tmp = path.with_name(path.name + '.tmp')
+        with open(tmp, 'wb') as f:
+            sp.save_npz(f, self.adjacency)
+        tmp.replace(path)
+
+    @staticmethod
+    def load(path):
+        return Graph(sp.load_npz(path))
+
+
+def ngl_graph(graph=None, knn=100, beta=1):
+    """The graph object of a named graph: one of topopy's (nglpy) graphs or a KnnGraph"""
+    if graph in KNN_GRAPHS:
+        return KnnGraph(knn, beta if KNN_GRAPHS[graph] else None)
+    if graph not in NGL_GRAPHS:
+        raise ValueError(f'unknown graph {graph}. Known graphs: {list(NGL_GRAPHS) + list(KNN_GRAPHS)}')
+    import nglpy as ngl
+    return ngl.EmptyRegionGraph(max_neighbors=knn, beta=beta, relaxed=NGL_GRAPHS[graph])
+
+
+def normalized(X, norm=None):
+    """The points as topopy normalizes them before building their graph"""
+    import sklearn.preprocessing
+    if norm == 'feature':
+        return sklearn.preprocessing.MinMaxScaler().fit_transform(np.atleast_2d(X))
+    if norm == 'zscore':
+        return sklearn.preprocessing.scale(X, axis=0, with_mean=True, with_std=True, copy=True)
+    return np.array(X)
+
+
+def knn_candidates(X, k, backend='sklearn', workers=None):
+    """The k nearest neighbors of each point, nearest first, as an (n, k) array.
+
+    As in nglpy, a point is counted as one of its own neighbors. The candidates for any smaller k are the first
+    k columns, so one query serves a whole range of knn values.
+    backend is 'sklearn' (what nglpy uses) or 'kdtree' (scipy's cKDTree). workers=-1 queries on all the cores
+    """
+    k = min(k, len(X))
+    if backend == 'kdtree':
+        from scipy.spatial import cKDTree
+        _, idx = cKDTree(X).query(X, k=k, workers=workers or 1)
+        return idx.reshape(len(X), k)
+    if backend == 'sklearn':
+        from sklearn.neighbors import NearestNeighbors
+        return NearestNeighbors(n_neighbors=k, n_jobs=workers).fit(X).kneighbors(X, return_distance=False)
+    raise ValueError(f'unknown knn backend {backend}. Known backends: {list(KNN_BACKENDS)}')
+
+
+def candidate_edges(candidates):
+    """The undirected edges (i < j) between the points and their candidate neighbors"""
+    n, k = candidates.shape
+    src, dst = np.repeat(np.arange(n, dtype=np.int64), k), candidates.ravel().astype(np.int64)
+    keep = src != dst
+    lo, hi = np.minimum(src[keep], dst[keep]), np.maximum(src[keep], dst[keep])
+    pairs = np.unique(lo * n + hi)
+    return np.c_[pairs // n, pairs % n]
+
+
+class PrunedGraph(Graph):
+    """A (relaxed) beta skeleton of given kNN candidates, e.g. a prefix of knn_candidates(X, k) for a larger k"""
+
+    def __init__(self, candidates, beta=1, graph='relaxed beta skeleton'):
+        super().__init__()
+        if graph not in NGL_GRAPHS:
+            raise ValueError(f'unknown graph {graph}. Known graphs: {list(NGL_GRAPHS)}')
+        self.candidates = np.asarray(candidates)
+        self.beta = beta
+        self.graph = graph
+
+    def build(self, X):
+        from nglpy.ngl import nglGraph, vectorDouble, vectorInt
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        n, d = X.shape
+        edges = candidate_edges(self.candidates)
+        pruned = nglGraph(vectorDouble(X.ravel().tolist()), n, d, self.graph, self.candidates.shape[1],
+                          float(self.beta), vectorInt(edges.ravel().tolist()), False)
+        self.adjacency = adjacency_of(pruned, n)
+
+
+def beta_skeleton(X, edges, witnesses, beta=1, chunk=CHUNK, workers=1):
+    """Which of the edges (p, q) have an empty region: none of their witnesses (an (m, w) array) is in it.
+
+    The region is the lune of the beta skeleton (the two balls of radius beta*|pq|/2 for beta >= 1, the points r
+    where the angle prq > pi - arcsin(beta) for beta < 1). With s = |r-p|^2, t = (r-p).(q-p) and l = |q-p|^2 a
+    witness is in the lune if s < beta*t and s - (2-beta)*t + (1-beta)*l < 0 (beta >= 1), or if s - t < 0 and
+    (s-t)^2 > (1-beta^2)*s*(s-2t+l) (beta < 1). The edges are tested in chunks of about chunk numbers, on workers
+    threads (-1 for all the cores)
+    """
+    X = np.asarray(X, dtype=np.float64)
+    sq = np.einsum('ij,ij->i', X, X)
+    keep = np.ones(len(edges), dtype=bool)
+    step = max(1, chunk // max(1, witnesses.shape[1] * X.shape[1]))
+
+    def test(first):
+        p, q = edges[first:first+step, 0], edges[first:first+step, 1]
+        w = witnesses[first:first+step]
+        P, U = X[p], X[q] - X[p]
+        dots = np.matmul(X[w], np.stack([P, U], axis=2))
+        pu, l = np.einsum('ij,ij->i', P, U)[:, None], np.einsum('ij,ij->i', U, U)[:, None]
+        s = sq[w] - 2 * dots[:, :, 0] + sq[p][:, None]
+        t = dots[:, :, 1] - pu
+        if beta >= 1:
+            inside = (s < beta * t) & (s - (2 - beta) * t + (1 - beta) * l < 0)
+        else:
+            inside = (s - t < 0) & ((s - t)**2 > (1 - beta**2) * s * (s - 2 * t + l))
+        inside &= (w != p[:, None]) & (w != q[:, None])
+        keep[first:first+step] = ~inside.any(axis=1)
+
+    workers = (os.cpu_count() or 1) if workers == -1 else workers
+    if workers > 1:
+        with ThreadPoolExecutor(workers) as pool:
+            list(pool.map(test, range(0, len(edges), step)))
+    else:
+        for first in range(0, len(edges), step):
+            test(first)
+    return keep
+
+
+class KnnGraph(Graph):
+    """The (symmetric) kNN graph of the points or, given beta, its beta skeleton.
+
+    The empty region of an edge pq is tested against the kNN of p and of q. For the usual knn values this is
+    nglpy's 'beta skeleton' but for a few edges; it is not nglpy's relaxed beta skeleton.
+    backend ('kdtree' or 'sklearn') queries the neighbors, and the edges are pruned, on workers threads (-1 for all
+    the cores)
+    """
+
+    def __init__(self, knn=100, beta=None, backend='kdtree', workers=-1, chunk=CHUNK):
+        super().__init__()
+        if backend not in KNN_BACKENDS:
+            raise ValueError(f'unknown knn backend {backend}. Known backends: {list(KNN_BACKENDS)}')
+        self.knn = knn
+        self.beta = beta
+        self.backend = backend
+        self.workers = workers
+        self.chunk = chunk
+
+    def build(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        n = len(X)
+        candidates = knn_candidates(X, self.knn, self.backend, self.workers)
+        edges = candidate_edges(candidates)
+        if self.beta is not None:
+            witnesses = np.concatenate([candidates[edges[:, 0]], candidates[edges[:, 1]]], axis=1)
+            edges = edges[beta_skeleton(X, edges, witnesses, self.beta, self.chunk, self.workers)]
+        rows, cols = np.r_[edges[:, 0], edges[:, 1]], np.r_[edges[:, 1], edges[:, 0]]
+        self.adjacency = sp.csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(n, n))
+
+
+def _digest(*arrays):
+    h = hashlib.sha1()
+    for a in arrays:
+        a = np.ascontiguousarray(a)
+        h.update(f'{a.dtype.str}{a.shape}'.encode())
+        h.update(a.data)
+    return h.hexdigest()
+
+
+def _describe_value(value):
+    if value is None or isinstance(value, (bool, int, float, str, np.number)):
+        return value
+    if sp.issparse(value):
+        m = sp.csr_matrix(value)
+        m.sort_indices()
+        return f'csr{m.shape}:{_digest(m.indptr, m.indices, m.data)}'
+    if isinstance(value, np.ndarray):
+        return f'array:{_digest(value)}'
+    raise TypeError(type(value).__name__)
+
+
+def describe(graph):
+    """A description of a graph (a name, a sparse adjacency matrix or a graph object) for the graph cache's key.
+
+    A graph object is described by its type and its attributes: scalars as they are, arrays and sparse matrices
+    by a hash of their content. None if an attribute can't be described this way
+    """
+    if isinstance(graph, str):
+        return graph
+    try:
+        if sp.issparse(graph):
+            return _describe_value(graph)
+        params = sorted((k, _describe_value(v)) for k, v in vars(graph).items())
+    except TypeError:
+        return None
+    return f'{type(graph).__name__}{params}'
+
+
+def graph_key(X, **params):
+    """A hash of the points and the parameters of the graph built over them"""
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    h = hashlib.sha1()
+    h.update(str(X.shape).encode())
+    h.update(X.data)
+    h.update(repr(sorted(params.items())).encode())
+    return h.hexdigest()
+
+
+class CachedGraph(Graph):
+    """A graph object whose graphs, built by the source graph object, are stored in (and reused from) a directory.
+
+    The graphs are keyed by a hash of the points and params (e.g. knn, beta, graph and norm), so a graph is only
+    built once for the same points and parameters. hit tells whether the last build came from the cache
+    """
+
+    def __init__(self, source, path=None, **params):
+        super().__init__()
+        self.source = source
+        self.path = Path(path) if path is not None else CACHE_DIR
+        self.params = params
+        self.hit = False
+
+    def build(self, X):
+        file = self.path / f'{graph_key(X, **self.params)}.npz'
+        self.hit = file.exists()
+        if self.hit:
+            self.adjacency = sp.load_npz(file)
+            return
+
+        self.source.build(X)
+        self.adjacency = getattr(self.source, 'adjacency', None)
+        if self.adjacency is None:
+            self.adjacency = adjacency_of(self.source, len(X))
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.save(file)
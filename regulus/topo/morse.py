@@ -1,8 +1,18 @@
+import inspect
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import scipy.sparse as sp
 from types import SimpleNamespace
 from topopy.MorseSmaleComplex import MorseSmaleComplex
+from topopy.TopologicalObject import TopologicalObject
 # import nglpy as ngl
 
 from regulus.topo.builder import Builder
+from regulus.core.data import Data
+from regulus.topo.graph import Graph, CachedGraph, ngl_graph, adjacency_of, normalized, describe, KNN_GRAPHS
+from regulus.topo import approx
 from regulus.topo import Regulus, Partition
 from regulus.tree import Node
 
@@ -16,37 +26,86 @@ defaults = SimpleNamespace(
         connect=False
 )
 
+# topopy 1.0 takes a graph object rather than the graph's name and parameters
+GRAPH_OBJECTS = 'max_neighbors' not in inspect.signature(MorseSmaleComplex.__init__).parameters
+
+
+def _provider(graph, knn, beta, norm, cache):
+    if isinstance(graph, str):
+        provider = ngl_graph(graph, knn, beta)
+    elif sp.issparse(graph):
+        provider = Graph(graph)
+    else:
+        provider = graph
+    if cache:
+        description = describe(graph)
+        if description is None:
+            warnings.warn(f'a {type(graph).__name__} graph can not be cached: it has attributes that are neither '
+                          f'scalars nor arrays')
+        else:
+            provider = CachedGraph(provider, None if cache is True else cache,
+                                   knn=knn, beta=beta, graph=description, norm=norm)
+    return provider
+
+
+def _complex(graph, knn, beta, norm, gradient, aggregator, connect, cache):
+    if not GRAPH_OBJECTS:
+        if not isinstance(graph, str) or graph in KNN_GRAPHS or cache:
+            raise ValueError('graph objects, knn graphs and the graph cache require topopy >= 1.0')
+        return MorseSmaleComplex(graph=graph, gradient=gradient, max_neighbors=knn, beta=beta,
+                                 normalization=norm, aggregator=aggregator, connect=connect)
+
+    if connect:
+        raise ValueError('connect is not supported by topopy >= 1.0')
+    provider = _provider(graph, knn, beta, norm, cache)
+    return MorseSmaleComplex(graph=provider, gradient=gradient, normalization=norm, aggregator=aggregator)
+
 
 def msc(data, kind='smale', measure=None, knn=defaults.knn, beta=defaults.beta, norm=defaults.norm,
         graph=defaults.graph, gradient=defaults.gradient, aggregator=defaults.aggregator, connect=defaults.connect,
-        debug=False):
-    """Compute a Morse-Smale Complex"""
+        precision=None, cache=None, sample=None, sampling='random', seed=None, aggregate=None, debug=False):
+    """Compute a Morse-Smale Complex.
+
+    graph is the name of a topopy graph or (topopy >= 1.0) 'knn' or 'knn beta skeleton' (see KnnGraph), or a graph
+    object such as a KnnGraph or a Graph over a precomputed sparse (CSR) adjacency matrix, which can also be given
+    directly. cache is a directory where the neighborhood graphs are kept (True for the default
+    directory), so that building again over the same points, e.g. for another measure or gradient, doesn't
+    recompute the graph.
+    precision ('float32' or 'float64') converts (a copy of) the data first. The regulus and its models then work in it.
+    sample (a number of points, a fraction of them as a float, or their indices) builds an approximate complex: the complex of
+    a 'random' or 'farthest' point sample (sampling), to which the other points are then assigned (see approx)
+    aggregate (a reducer such as 'mean' or 'max', or True for 'mean') first replaces the duplicate points by one
+    point each, whose values are aggregated by it. The regulus is then over the aggregated data (see
+    Data.aggregate), whose rows map back to the raw ones (Partition.raw_idx)
+    """
+    if precision is not None:
+        data = data.as_precision(precision)
+    if aggregate:
+        data = data.aggregate('mean' if aggregate is True else aggregate)
+        if debug and data.groups is not None:
+            print(f'aggregated {data.groups.duplicates} duplicate points')
 
     if measure is None:
         measure = list(data.values.columns)[-1]
     elif type(measure) == int:
         measure = list(data.values.columns)[measure]
 
-    # TODO: that's an unexpected side-effect.
-    #       either make the user do this step outside of this function or
-    #       provide a parameter to explicitly ask for that
-    # topopy ver 1.0: comment out. Is this correct?
-    # x, values = TopologicalObject.aggregate_duplicates(data.x.values, data.values.values)
-    # if x.shape != data.x.shape:
-    #     data.x = pd.DataFrame(x, columns=data.x.columns)
-    #     data.values = pd.DataFrame(values, columns=data.values.columns)
-
     y = data.values.loc[:, measure]
 
-    topo = MorseSmaleComplex(graph=graph, gradient=gradient, max_neighbors=knn, beta=beta,
-                             normalization=norm, aggregator=aggregator, connect=connect)
+    topo = _complex(graph, knn, beta, norm, gradient, aggregator, connect, cache)
     # topopy ver 1.0: remove names
     # topo.build(X=data.x.values, Y=y.values, names=list(data.x.columns)+[y.name])
-    topo.build(X=data.x.values, Y=y.values)
-
-    # topopy version 1.0.0
-    # graph = ngl.EmptyRegionGraph(beta=beta, relaxed=False, p=2.0)
-    # topo = MorseSmaleComplex(graph=graph, gradient=gradient, normalization=norm, aggregator=aggregator)
+    # the graph library only takes doubles
+    x, yv = data.x.values.astype(np.float64, copy=False), y.values.astype(np.float64, copy=False)
+    if sample is None:
+        topo.build(X=x, Y=yv)
+    else:
+        xn = normalized(x, norm)
+        pts = approx.subsample(xn, sample, sampling, seed)
+        topo.build(X=x[pts], Y=yv[pts])
+
+    if debug and isinstance(getattr(topo, 'graph', None), CachedGraph):
+        print('graph:', 'from cache' if topo.graph.hit else 'built')
 
     builder = Builder(debug).data(y)
 
@@ -57,7 +116,10 @@ def msc(data, kind='smale', measure=None, knn=defaults.knn, beta=defaults.beta,
     # else:
     #     builder.msc(topo.ascending_partitions, topo.min_hierarchy)
 
-    builder.msc(topo.base_partitions, topo.get_merge_sequence())
+    if sample is None:
+        builder.msc(topo.base_partitions, topo.get_merge_sequence())
+    else:
+        builder.msc(*approx.extend(topo, pts, xn, yv))
 
     builder.build()
 
@@ -67,6 +129,56 @@ def msc(data, kind='smale', measure=None, knn=defaults.knn, beta=defaults.beta,
     return regulus
 
 
+def _flow(x, y, kind, measure, graph, kwargs):
+    """One measure's complex over a prebuilt graph (in a worker process): its pts_loc and tree arrays"""
+    from regulus.utils.store import tree_arrays
+    regulus = msc(Data(x, y), kind, measure, graph=graph, **kwargs)
+    return regulus.pts_loc, tree_arrays(regulus)
+
+
+def msc_many(data, measures=None, kind='smale', processes=None, knn=defaults.knn, beta=defaults.beta,
+             norm=defaults.norm, graph=defaults.graph, precision=None, cache=None, debug=False, **kwargs):
+    """Compute the Morse-Smale Complexes of several measures (all the value columns by default) of the same points.
+
+    The neighborhood graph is built once, and each measure's gradient flow and hierarchy are computed in
+    parallel worker processes (processes=1 computes them in this process). The other kwargs (gradient,
+    aggregator) are passed to msc. Returns a dict of Regulus objects by measure, which share data.
+    """
+    from regulus.utils.store import build_tree
+    if not GRAPH_OBJECTS:
+        raise ValueError('msc_many requires topopy >= 1.0')
+    if precision is not None:
+        data = data.as_precision(precision)
+
+    columns = list(data.values.columns)
+    if measures is None:
+        measures = columns
+    measures = [columns[m] if type(m) == int else m for m in measures]
+
+    x = data.x.values.astype(np.float64, copy=False)
+    topo = TopologicalObject(graph=_provider(graph, knn, beta, norm, cache), normalization=norm)
+    topo.build(X=x, Y=np.zeros(len(x)))
+    shared = Graph(topo.graph.adjacency if isinstance(topo.graph, Graph) else adjacency_of(topo.graph, len(x)))
+    if debug and isinstance(topo.graph, CachedGraph):
+        print('graph:', 'from cache' if topo.graph.hit else 'built')
+
+    kwargs.update(norm=norm, debug=debug)
+    jobs = [(data.x, data.values[[m]], kind, m, shared, kwargs) for m in measures]
+    processes = min(processes or os.cpu_count() or 1, len(jobs))
+    if processes > 1:
+        with ProcessPoolExecutor(processes) as pool:
+            results = list(pool.map(_flow, *zip(*jobs)))
+    else:
+        results = [_flow(*job) for job in jobs]
+
+    reguli = {}
+    for measure, (pts_loc, arrays) in zip(measures, results):
+        regulus = Regulus(data, pts_loc, measure, type=kind)
+        regulus.tree.root = build_tree(regulus, arrays)
+        reguli[measure] = regulus
+    return reguli
+
+
 def _visit(p, parent, regulus, offset):
     partition = Partition(p.id,
                           p.persistence,
@@ -1,6 +1,10 @@
 import pandas as pd
+from traitlets import observe
 from regulus.tree import HasTree, Node, Tree
 from regulus.core import HasAttrs
+from regulus.models.moments import Moments
+from regulus.models.inv_curves import InverseCurves
+from regulus.models.predictions import Predictions
 
 
 class Partition(object):
@@ -53,6 +57,12 @@ class Partition(object):
             self._idx = idx
         return self._idx
 
+    @property
+    def raw_idx(self):
+        """The rows of the raw data of the partition's points: all the duplicates of each point, if the data was
+        aggregated (see Data.aggregate)"""
+        return self.regulus.pts.expand(self.idx)
+
     @property
     def x(self):
         if self._x is None:
@@ -63,8 +73,7 @@ class Partition(object):
     @property
     def original_x(self):
         if self._original_x is None:
-            idx = self.idx
-            self._original_x = self.regulus.pts.original_x.loc[idx]
+            self._original_x = self.regulus.pts.inverse(self.x)
         return self._original_x
 
     @property
@@ -119,6 +128,8 @@ class RegulusTree(Tree, HasAttrs):
                                                     regulus=self.regulus),
                              children=value, offset=0)
         self._root = value
+        if getattr(self.regulus, 'tree', None) is self:
+            self.regulus._reset()
         # self.attr['data_size'] = self.regulus.pts.size()
         # self.attr['data_range'] = [min(self.regulus.y), max(self.regulus.y)]
         if value is not None and value.parent is None:
@@ -183,22 +194,110 @@ class RegulusTree(Tree, HasAttrs):
 
 
 class Regulus(HasTree, HasAttrs):
+    # statistics of the points of the partitions, computed on first use. Not saved
+    _derived = ('_moments', '_inverse_curves', '_predictions')
+
     def __init__(self, pts, pts_loc, measure, tree=None, type='smale'):
         super().__init__()
         self.type = type
         self.filename = None
+        self.measure = measure
         self.pts = pts
         self.pts_loc = pts_loc
-        self.measure = measure
-        self.y = pts.y(measure)
         self.attr['data_size'] = self.pts.size()
         self.attr['data_range'] = [min(self.y), max(self.y)]
         self.tree = tree if tree is not None else RegulusTree(regulus=self)
 
+    @property
+    def pts(self):
+        return self._pts
+
+    @pts.setter
+    def pts(self, value):
+        self._pts = value
+        self.y = value.y(self.measure)
+        self._reset()
+
+    @observe('tree')
+    def _tree_changed(self, change):
+        self._reset()
+
+    def _reset(self):
+        """Drop the statistics derived from the points and the tree, when either is replaced"""
+        for name in self._derived:
+            self.__dict__[name] = None
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        for name in self._derived:
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        if 'pts' in state:
+            # files saved before pts was a property
+            state = dict(state)
+            state['_pts'] = state.pop('pts')
+        super().__setstate__(state)
+
     @property
     def scaler(self):
         return self.pts.scaler
 
+    @property
+    def moments(self):
+        """Per-partition sufficient statistics, computed on first use"""
+        return self.design_moments(degree=1)
+
+    def design_moments(self, degree=1, **kwargs):
+        """Per-partition sufficient statistics of a polynomial design, computed on first use.
+
+        kwargs (e.g. keep) are passed to Moments.from_regulus the first time the degree is requested
+        """
+        if getattr(self, '_moments', None) is None:
+            self._moments = {}
+        if degree not in self._moments:
+            self._moments[degree] = Moments.from_regulus(self, degree=degree, **kwargs)
+        return self._moments[degree]
+
+    def inverse_curves(self, **kwargs):
+        """Inverse regression curves of all the partitions on a shared grid, computed on first use"""
+        if getattr(self, '_inverse_curves', None) is None:
+            self._inverse_curves = {}
+        key = tuple(sorted(kwargs.items()))
+        if key not in self._inverse_curves:
+            self._inverse_curves[key] = InverseCurves(self, **kwargs)
+        return self._inverse_curves[key]
+
+    def inverse_curves_of(self, name='inverse_regression', context=None, build=True):
+        """The shared curves an inverse regression attribute (of context, by default the regulus') is computed from.
+
+        These are the curves of the attribute's curves parameters (see add_inverse), or None if it has none. Unless
+        build is True, the curves are returned only if they were computed already
+        """
+        context = context if context is not None else self.attr
+        attr = context[name] if name in context else None
+        params = getattr(attr, 'properties', {}).get('curves', None)
+        if params is None:
+            return None
+        if not build:
+            return (getattr(self, '_inverse_curves', None) or {}).get(tuple(sorted(params.items())), None)
+        return self.inverse_curves(**params)
+
+    def predictions(self, name='model'):
+        """Predictions and residuals of a model attribute on the partitions' points, computed on first use.
+
+        They are recomputed if the attribute was replaced, cleared or assigned a model since
+        """
+        if getattr(self, '_predictions', None) is None:
+            self._predictions = {}
+        models = self.attr[name]
+        entry = self._predictions.get(name, None)
+        version = getattr(models, 'version', 0)
+        if entry is None or entry[0] is not models or entry[1] is not models.cache or entry[2] != version:
+            entry = self._predictions[name] = (models, models.cache, version, Predictions(self, name))
+        return entry[3]
+
     @property
     def x(self):
         return self.pts.x
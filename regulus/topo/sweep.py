@@ -0,0 +1,96 @@
+"""Morse-Smale Complexes over a grid of knn and beta values.
+
+The kNN candidates are computed once, for the largest knn. Each setting prunes a prefix of them and builds its
+complex in a worker process.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from time import perf_counter
+import numpy as np
+import pandas as pd
+
+from regulus.core.data import Data
+from regulus.topo import Regulus
+from regulus.topo.graph import Graph, PrunedGraph, knn_candidates, normalized
+from regulus.topo.morse import msc, defaults
+from regulus.tree.arrays import TreeArrays
+
+QUANTILES = (0, 0.25, 0.5, 0.75, 1)
+
+
+def summary(regulus):
+    """The number of partitions (all and base ones) and the distribution of their persistence"""
+    arrays = TreeArrays(regulus.tree.root)
+    real = arrays.ids >= 0
+    has_children = np.zeros(len(arrays.ids), dtype=bool)
+    has_children[arrays.parent[arrays.parent >= 0]] = True
+    persistence = arrays.persistence[real]
+    stats = dict(partitions=int(real.sum()), base=int((real & ~has_children).sum()))
+    for q, v in zip(QUANTILES, np.quantile(persistence, QUANTILES) if len(persistence) else [np.nan] * 5):
+        stats[f'persistence_{int(q * 100)}'] = float(v)
+    return stats
+
+
+def _setting(x, y, measure, candidates, beta, graph, norm, keep, kwargs):
+    """Build one setting's complex (in a worker process): its summary, timing and (if keep) its tree"""
+    from regulus.utils.store import tree_arrays
+    t = perf_counter()
+    pruned = PrunedGraph(candidates, beta, graph)
+    pruned.build(normalized(x.values.astype(np.float64, copy=False), norm))
+    t_graph = perf_counter() - t
+
+    t = perf_counter()
+    regulus = msc(Data(x, y), measure=measure, graph=Graph(pruned.adjacency), norm=norm,
+                  knn=candidates.shape[1], beta=beta, **kwargs)
+    t_msc = perf_counter() - t
+
+    stats = summary(regulus)
+    stats.update(edges=int(pruned.adjacency.nnz // 2), graph_time=t_graph, msc_time=t_msc)
+    return stats, (regulus.pts_loc, tree_arrays(regulus)) if keep else None
+
+
+def sweep(data, knn=(8, 16, 32, 64, 100), beta=(1,), measure=None, processes=None, keep=False,
+          graph=defaults.graph, norm=defaults.norm, **kwargs):
+    """Compute the Morse-Smale Complexes of data for every combination of the knn and beta values.
+
+    Returns a DataFrame with a row per setting: the number of partitions and base partitions, the quantiles of the
+    partitions' persistence, the number of graph edges, and the time it took to prune the graph and to build the
+    complex. The time of the shared kNN query is in the DataFrame's attrs['candidates_time']. With keep=True a
+    regulus column holds the Regulus of each setting (over the same data).
+    The settings are built in parallel worker processes (processes=1 builds them in this process). The other
+    kwargs (gradient, aggregator) are passed to msc.
+    """
+    from regulus.utils.store import build_tree
+    if measure is None:
+        measure = list(data.values.columns)[-1]
+    elif type(measure) == int:
+        measure = list(data.values.columns)[measure]
+    knn, beta = sorted(set(knn)), sorted(set(beta))
+
+    t = perf_counter()
+    x = data.x.values.astype(np.float64, copy=False)
+    candidates = knn_candidates(normalized(x, norm), max(knn))
+    t_candidates = perf_counter() - t
+
+    settings = list(product(knn, beta))
+    y = data.values[[measure]]
+    jobs = [(data.x, y, measure, candidates[:, :k], b, graph, norm, keep, kwargs) for k, b in settings]
+    processes = min(processes or os.cpu_count() or 1, len(jobs))
+    if processes > 1:
+        with ProcessPoolExecutor(processes) as pool:
+            results = list(pool.map(_setting, *zip(*jobs)))
+    else:
+        results = [_setting(*job) for job in jobs]
+
+    rows = []
+    for (k, b), (stats, tree) in zip(settings, results):
+        row = dict(knn=k, beta=b, **stats)
+        if keep:
+            regulus = Regulus(data, tree[0], measure, type=kwargs.get('kind', 'smale'))
+            regulus.tree.root = build_tree(regulus, tree[1])
+            row['regulus'] = regulus
+        rows.append(row)
+    table = pd.DataFrame(rows)
+    table.attrs['candidates_time'] = t_candidates
+    return table
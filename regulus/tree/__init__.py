@@ -4,6 +4,7 @@ from .traverse import *
 from .alg import *
 from .apply import *
 from .hastree import *
+from .arrays import TreeArrays
 # from .adaptive_tree import AdaptiveTree
 # from .simplified import SimplifiedTree
 from .transform import TransformTree
@@ -0,0 +1,39 @@
+import numpy as np
+
+from .batch import top
+from .traverse import depth_first
+
+
+class TreeArrays(object):
+    """The nodes of a tree, in depth first order, and the properties of their partitions as arrays.
+
+    This is what a vectorized attribute's factory, f(context, arrays), receives. It returns the values of all the
+    nodes as one column (in the order of arrays.nodes).
+    parent is the index of each node's parent (-1 for the top), span the partitions' pts_span, minmax their
+    minmax_idx and size their number of points (span and extrema). column(name) returns the values of an existing
+    attribute.
+    """
+
+    def __init__(self, root, context=None):
+        self.root = root
+        self.context = context
+        self.nodes = list(depth_first(root))
+        position = {id(node): i for i, node in enumerate(self.nodes)}
+        data = [node.data for node in self.nodes]
+
+        self.ids = np.array([node.id for node in self.nodes], dtype=int)
+        self.parent = np.array([position.get(id(node.parent), -1) for node in self.nodes], dtype=int)
+        self.span = np.array([getattr(p, 'pts_span', (0, 0)) for p in data], dtype=int).reshape(-1, 2)
+        self.minmax = np.array([getattr(p, 'minmax_idx', (0, 0)) for p in data], dtype=int).reshape(-1, 2)
+        self.persistence = np.array([getattr(p, 'persistence', 0) for p in data], dtype=float)
+        self.size = self.span[:, 1] - self.span[:, 0] + np.array([len(getattr(p, 'extrema', ())) for p in data])
+        self.regulus = getattr(root.data, 'regulus', None)
+
+    @staticmethod
+    def of(node, context=None):
+        """Arrays of the whole tree the node belongs to"""
+        return TreeArrays(top(node), context)
+
+    def column(self, name):
+        values = self.context[name]
+        return np.array([values[node] for node in self.nodes])
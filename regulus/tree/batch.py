@@ -0,0 +1,28 @@
+"""Attributes that are computed for all the nodes of a tree at once"""
+from .traverse import depth_first
+
+
+def top(node):
+    """The top of the tree node belongs to"""
+    while node.parent is not None:
+        node = node.parent
+    return node
+
+
+def fill_tree(context, name, key, batch, single, keys=None):
+    """The value of attribute name at key (a node or a pair of nodes), computed with all the tree's values.
+
+    batch(context, root) returns a dict of the values it computes together, for the keys of the tree (its nodes,
+    or keys(root)). The other keys are computed one at a time by single(context, key). All of them are stored in
+    the attribute's cache, so the tree is scanned once (until the attribute is cleared).
+    """
+    root = top(key[-1] if isinstance(key, tuple) else key)
+    values = batch(context, root)
+    cache = context[name]
+    for k in (keys(root) if keys is not None else depth_first(root)):
+        cache.put(k, values[k] if k in values else _single(context, k, single))
+    return values[key] if key in values else _single(context, key, single)
+
+
+def _single(context, key, single):
+    return single(context, *key) if isinstance(key, tuple) else single(context, key)
@@ -0,0 +1,185 @@
+"""Build and save the reguli of many csv files (the regulus command line).
+
+The files are processed by a pool of worker processes. Each output has a .sha1 file next to it with the hash of
+its input's content and of the options it was built with, so files whose output is up to date are skipped.
+process() returns a summary of each file: its status, the time of each stage and, when the file was built in a
+process of its own, the peak memory of that process.
+"""
+import csv
+import glob
+import hashlib
+import inspect
+import resource
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from time import perf_counter
+
+from regulus.core.cache import Cache
+from .io import from_csv, save
+
+SUFFIX = {'pickle': '.regulus', 'columns': '.rgl'}
+STAGES = ('read', 'normalize', 'msc', 'attributes', 'precompute', 'save')
+
+
+def inputs_of(patterns):
+    """The csv files of a list of files, glob patterns and directories (all the csv files in them, recursively)"""
+    files = []
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            files.extend(sorted(path.rglob('*.csv')))
+        elif path.exists():
+            files.append(path)
+        else:
+            files.extend(Path(p) for p in sorted(glob.glob(pattern, recursive=True)) if Path(p).is_file())
+    unique = {}
+    for file in files:
+        unique.setdefault(file.resolve(), file)
+    return list(unique.values())
+
+
+def content_hash(filename, options, block=2**24):
+    """A hash of a file's content and of the options its output is built with"""
+    h = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for buffer in iter(lambda: f.read(block), b''):
+            h.update(buffer)
+    h.update(repr(sorted(options.items())).encode())
+    return h.hexdigest()
+
+
+def output_of(filename, out=None, format='pickle'):
+    """The output of filename: in the out directory, or next to it, with the format's suffix"""
+    filename = Path(filename)
+    directory = Path(out) if out is not None else filename.parent
+    return directory / (filename.stem + SUFFIX[format])
+
+
+def _stamp(output):
+    return output.with_name(output.name + '.sha1')
+
+
+def up_to_date(output, digest):
+    stamp = _stamp(output)
+    return output.exists() and stamp.exists() and stamp.read_text().strip() == digest
+
+
+def precompute(regulus, attrs):
+    """Evaluate the attributes (of the regulus or its tree) for all the nodes, so they are saved with it.
+    'all' is every attribute that isn't dynamic. Attributes of pairs of nodes are left to be computed on use"""
+    def per_node(cache):
+        return cache.factory is not None and len(inspect.signature(cache.factory).parameters) == 2
+
+    def attributes(owner):
+        return {name: cache for name, cache in owner.attr.cache.items() if isinstance(cache, Cache) and per_node(cache)}
+
+    missing = set(attrs) - {'all'} - set(attributes(regulus)) - set(attributes(regulus.tree))
+    if missing:
+        raise ValueError(f'unknown attributes (or attributes of pairs of nodes): {sorted(missing)}')
+    nodes = list(regulus.tree)
+    for owner in (regulus, regulus.tree):
+        names = [name for name, cache in attributes(owner).items() if not cache.dynamic] \
+            if 'all' in attrs else [name for name in attrs if name in attributes(owner)]
+        for name in names:
+            values = owner.attr[name]
+            for node in nodes:
+                values[node]
+
+
+def peak_memory():
+    """The peak resident memory of this process, in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+def build(filename, output, digest, options, attrs=(), format='pickle', memory=True):
+    """Build, precompute and save the regulus of one file. Returns its summary.
+
+    The summary has the peak memory of the process if memory is True, i.e. if the process built only this file
+    """
+    summary = dict(file=str(filename), output=str(output), status='done')
+    start = perf_counter()
+    try:
+        stages = []
+        regulus = from_csv(filename, stages=stages, **options)
+
+        t = perf_counter()
+        precompute(regulus, attrs)
+        stages.append(('precompute', perf_counter() - t))
+
+        t = perf_counter()
+        output.parent.mkdir(parents=True, exist_ok=True)
+        save(regulus, output, format=format)
+        _stamp(output).write_text(digest)
+        stages.append(('save', perf_counter() - t))
+
+        summary.update(points=len(regulus.pts_loc), partitions=len([n for n in regulus.tree if n.id >= 0]))
+        summary.update(stages)
+    except Exception as e:
+        summary.update(status='failed', error=f'{type(e).__name__}: {e}')
+        traceback.print_exc()
+    summary.update(total=perf_counter() - start)
+    if memory:
+        summary.update(memory=peak_memory())
+    return summary
+
+
+def process(patterns, out=None, workers=None, format='pickle', attrs=(), force=False, output=None, **options):
+    """Build and save the regulus of each csv file of patterns (see inputs_of) with workers processes.
+
+    options (ndims, knn, beta, measure, ...) are passed to from_csv. The outputs go to the out directory (next to
+    their input by default), or to output if there is a single input. Outputs that are up to date are skipped,
+    unless force is True. A file whose output is that of a previous file fails. Returns a summary of each file
+    """
+    files = inputs_of(patterns)
+    if output is not None and len(files) != 1:
+        raise ValueError('an output file can only be given for a single input')
+
+    summaries, jobs, targets = [], [], {}
+    for file in files:
+        target = Path(output) if output is not None else output_of(file, out, format)
+        target = target.with_suffix(SUFFIX[format])
+        if target.resolve() in targets:
+            summaries.append(dict(file=str(file), output=str(target), status='failed',
+                                  error=f'same output as {targets[target.resolve()]}'))
+            continue
+        targets[target.resolve()] = file
+        digest = content_hash(file, dict(options, attrs=sorted(attrs), format=format))
+        if not force and up_to_date(target, digest):
+            summaries.append(dict(file=str(file), output=str(target), status='skipped'))
+        else:
+            jobs.append((file, target, digest, options, tuple(attrs), format))
+
+    workers = min(workers or 1, len(jobs)) if jobs else 0
+    if workers > 1:
+        # a fresh process per file, so the peak memory is that file's. Older pythons reuse the workers
+        fresh = sys.version_info >= (3, 11)
+        with ProcessPoolExecutor(workers, **(dict(max_tasks_per_child=1) if fresh else {})) as pool:
+            summaries.extend(pool.map(build, *zip(*jobs), [fresh] * len(jobs)))
+    else:
+        # in this process the peak memory is that of all the files so far
+        summaries.extend(build(*job, memory=False) for job in jobs)
+    order = {str(file): i for i, file in enumerate(files)}
+    return sorted(summaries, key=lambda s: order[s['file']])
+
+
+def write_summary(summaries, filename):
+    columns = ['file', 'output', 'status', 'points', 'partitions', *STAGES, 'total', 'memory', 'error']
+    with open(filename, 'w', newline='') as f:
+        writer = csv.DictWriter(f, columns, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(summaries)
+
+
+def report(summaries):
+    for s in summaries:
+        if s['status'] == 'done':
+            print(f"{s['file']}: {s['total']:.2f}s  " +
+                  '  '.join(f'{name}: {s[name]:.2f}s' for name in STAGES if name in s) +
+                  (f"  memory: {s['memory']:.0f}MB" if 'memory' in s else '') + f"  partitions: {s['partitions']}")
+        else:
+            print(f"{s['file']}: {s['status']}" + (f"  {s['error']}" if 'error' in s else ''))
+    counts = {status: sum(s['status'] == status for s in summaries) for status in ('done', 'skipped', 'failed')}
+    print('  '.join(f'{status}: {n}' for status, n in counts.items()))
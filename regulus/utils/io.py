@@ -1,17 +1,42 @@
+import copyreg
 import pickle
 
 from pathlib import Path
-from time import process_time
+from time import perf_counter
 
 from regulus.core.data import Data
 from regulus.topo import msc, Regulus
 from regulus.measures import *
 from regulus.models import *
 from regulus.core import UNIT_RANGE
+from regulus.core.cache import Cache
 from regulus.alg import *
+from . import store
 
 
-def load(filename):
+class _Pickler(pickle.Pickler):
+    """Pickles the models of an attribute as dense arrays (a ModelTable) rather than as one estimator per node,
+    without changing the attribute's cache"""
+
+    def reducer_override(self, obj):
+        if type(obj) is Cache:
+            table = tabulate(obj.cache)
+            if table is not None and table is not obj.cache:
+                return copyreg.__newobj__, (Cache,), dict(obj.__getstate__(), cache=table)
+        return NotImplemented
+
+
+def load(filename, mmap=True):
+    """Load a regulus file. Columnar (.rgl) files are memory mapped unless mmap is False.
+
+    A filename without a suffix (or one that doesn't exist) is looked up as a .rgl directory, then as a .regulus file
+    """
+    if store.is_columnar(filename):
+        return store.load(filename, mmap=mmap)
+    if Path(filename).suffix == '' or not Path(filename).exists():
+        columnar = Path(filename).with_suffix('.rgl')
+        if store.is_columnar(columnar):
+            return store.load(columnar, mmap=mmap)
     path = Path(filename).with_suffix('.regulus')
     with open(path, 'rb') as f:
         t = pickle.load(f)
@@ -21,30 +46,54 @@ def load(filename):
         raise Exception('file %1 is not a Regulus file'.format(filename))
 
 
-def save(regulus, filename=None):
+def save(regulus, filename=None, format=None):
+    """Save regulus as a pickle (.regulus) or in the columnar format (format='columns', a .rgl directory).
+
+    By default the format is that of the regulus' current file
+    """
     if filename is None and regulus.filename is None:
         raise(Exception("Filename must be provide when the Regulus object doesn't have a default filename"))
 
     if filename is None:
         filename = regulus.filename
+    if format is None:
+        format = 'columns' if store.is_columnar(filename) else 'pickle'
+
+    if format == 'columns':
+        path = Path(filename).with_suffix('.rgl')
+        store.save(regulus, path)
+        if regulus.filename is None:
+            regulus.filename = path
+        return
+
     path = Path(filename).with_suffix('.regulus')
     if regulus.filename is None:
         regulus.filename = path
 
     with open(path, 'wb') as f:
-        pickle.dump(regulus, f)
+        _Pickler(f).dump(regulus)
+
+
+def compact(filename):
+    """Remove the files of a columnar regulus file that previous incremental saves left behind"""
+    return store.compact(filename)
+
+
+def convert(filename, dst=None):
+    """Convert a pickled .regulus file to the columnar format"""
+    return store.convert(Path(filename).with_suffix('.regulus'), dst)
 
 
 def add_defaults(regulus):
-    regulus.add_attr(inverse_regression)
+    regulus.add_attr(inverse_regression, curves=INVERSE_CURVES)
 
     # models
-    regulus.add_attr(linear_model, name='linear')
-    regulus.add_attr(ridge_model, name='ridge')
-    regulus.add_attr(ridge_model, name='model')
+    regulus.add_attr(batch_linear_model, name='linear')
+    regulus.add_attr(batch_ridge_model, name='ridge')
+    regulus.add_attr(batch_ridge_model, name='model')
     regulus.add_attr(shared_model)
 
-    regulus.add_attr(quadratic_model, name='quadratic')
+    regulus.add_attr(batch_quadratic_model, name='quadratic')
     regulus.add_attr(quadratic_fitness, name='q_fitness', range=UNIT_RANGE)
 
     # node's attributes
@@ -61,7 +110,7 @@ def add_defaults(regulus):
     regulus.add_attr(stepwise_fitness)
 
     # dims approach
-    regulus.add_attr(dim_model)
+    regulus.add_attr(batch_dim_model, name='dim_model')
 
     regulus.add_attr(dim_score, requires=['dim_model'])
     regulus.add_attr(dim_min, requires=['dim_score'])
@@ -77,6 +126,7 @@ def add_defaults(regulus):
     regulus.tree.add_attr(node_size, name='size')
     regulus.tree.add_attr(node_relative_size, name='rel_size', range=UNIT_RANGE)
     regulus.tree.add_attr(node_span, name='span', range=UNIT_RANGE, dynamic=True)
+    regulus.tree.add_attr(node_persistence, name='persistence')
 
     # coef
     regulus.add_attr(coef_change, range=UNIT_RANGE, dynamic=True, requires=['model'])
@@ -87,40 +137,68 @@ def add_defaults(regulus):
 
 
 
+def _report(stages):
+    total = sum(t for _, t in stages)
+    print('time: ' + '  '.join(f'{name}: {t:.3f}s' for name, t in stages) + f'  total: {total:.3f}s')
+
+
 def from_csv(filename, **kwargs):
+    """Build a Regulus from a csv file.
+
+    ndims, dtype, usecols, chunksize and path (a .npy file to memory map the data to) are passed to Data.read_csv.
+    precision='float32' reads the data as float32 (unless dtype is given) and keeps it so through the pipeline.
+    With debug=True the wall clock time of each stage is reported. A stages list, if given, receives the
+    (stage, seconds) pairs
+    """
     path = Path(filename)
     if not path.exists():
         if path.suffix == '':
             if not path.with_suffix('.csv').exists():
                 raise FileNotFoundError(f"File '{filename}[.csv]' does not exist")
 
-    t_start = process_time()
-    ndims = kwargs.pop('ndims', None)
-    pts = Data.read_csv(path.with_suffix('.csv'), ndims=ndims)
-    t_read = process_time()
+    stages = kwargs.pop('stages', None)
+    stages = stages if stages is not None else []
+    t = perf_counter()
+    read = {key: kwargs.pop(key) for key in ('ndims', 'dtype', 'usecols', 'chunksize', 'path') if key in kwargs}
+    if kwargs.get('precision', None) is not None:
+        read.setdefault('dtype', kwargs['precision'])
+    pts = Data.read_csv(path.with_suffix('.csv'), **read)
+    stages.append(('read', perf_counter() - t))
 
+    t = perf_counter()
     if kwargs.pop('normalize', True):
         pts.normalize()
+    stages.append(('normalize', perf_counter() - t))
+
+    t = perf_counter()
     regulus = msc(pts, **kwargs)
-    t_msc = process_time()
+    stages.append(('msc', perf_counter() - t))
 
+    t = perf_counter()
     add_defaults(regulus)
+    stages.append(('attributes', perf_counter() - t))
 
-    t_end = process_time()
     if kwargs.get('debug', False):
-        print(f'time: {t_end - t_start:.3} ')
+        _report(stages)
     return regulus
 
 
 def from_df(df, **kwargs):
-    t_start = process_time()
-    pts = Data.from_df(df, ndims = kwargs.pop('ndims', None))
+    stages = []
+    t = perf_counter()
+    pts = Data.from_df(df, ndims=kwargs.pop('ndims', None), precision=kwargs.get('precision', None))
     if kwargs.pop('normalize', True):
         pts.normalize()
+    stages.append(('normalize', perf_counter() - t))
+
+    t = perf_counter()
     regulus = msc(pts, **kwargs)
+    stages.append(('msc', perf_counter() - t))
+
+    t = perf_counter()
     add_defaults(regulus)
+    stages.append(('attributes', perf_counter() - t))
 
-    t_end = process_time()
     if kwargs.get('debug', False):
-        print(f'time: {t_end - t_start:.3}')
+        _report(stages)
     return regulus
@@ -0,0 +1,441 @@
+"""Columnar .regulus format.
+
+A Regulus is saved as a directory of arrays rather than as one pickle:
+
+    meta.pkl            format version, measure, columns, scaler, attribute definitions (no values), file names
+    x.npy, values.npy   the points, in their original row order (memory mapped on load)
+    groups.npy          for aggregated data, the group of each raw row (see Data.aggregate)
+    pts_loc.npy         the points in span order: a partition's points are pts_loc[span] and its extrema
+    tree.<generation>.npz
+                        the tree as arrays, in depth first order (see TreeArrays)
+    attrs/<scope>/<name>.<generation>.npz|.pkl
+                        one file per attribute. Numbers, vectors of numbers and models (as a ModelTable)
+                        are stored as arrays, anything else is pickled. Attributes are loaded on first use.
+
+Saving into the file a Regulus was loaded from (or last saved to) is incremental: only the attributes that were
+added, changed (see HasAttrs.mark_changed) or got new values (see Cache.dirty) are written, each to a new file of
+the next generation, and the points (x, values, pts_loc, groups) and the tree only if they changed (their digests
+differ). A full save into an existing file writes everything, the points too, to files of the next generation
+(x.<generation>.npy, ...). Either way meta.pkl is replaced last, so a
+crash leaves the previous save intact. compact() removes the files that are no longer referenced.
+"""
+import hashlib
+import pickle
+from collections import defaultdict
+from collections.abc import MutableMapping
+from pathlib import Path
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+from regulus.core.cache import Cache
+from regulus.core.data import Data
+from regulus.core.groups import Groups
+from regulus.models.model_table import ModelTable, tabulate
+from regulus.topo import Regulus
+from regulus.topo.regulus import Partition
+from regulus.tree import Node
+from regulus.tree.arrays import TreeArrays
+
+FORMAT = 'regulus-columns'
+VERSION = 1
+
+
+def is_columnar(path):
+    return Path(path).is_dir() and (Path(path) / 'meta.pkl').exists()
+
+
+def _write(path, write):
+    """Write a file through a temporary file and a rename, so a crash never leaves a partially written file"""
+    path = Path(path)
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'wb') as f:
+        write(f)
+    tmp.replace(path)
+
+
+def _save_npy(path, array):
+    _write(path, lambda f: np.save(f, array))
+
+
+def _save_npz(path, **arrays):
+    _write(path, lambda f: np.savez(f, **arrays))
+
+
+def _save_pickle(path, obj):
+    _write(path, lambda f: pickle.dump(obj, f))
+
+
+class LazyColumn(MutableMapping):
+    """The values of an attribute, read from disk on first access.
+
+    dirty is set once the values are modified, i.e. they differ from the file they were read from
+    """
+
+    def __init__(self, loader=None, data=None):
+        self._loader = loader
+        self._data = data
+        self.dirty = False
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = self._loader()
+            self._loader = None
+        return self._data
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self.dirty = True
+
+    def __delitem__(self, key):
+        del self.data[key]
+        self.dirty = True
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getstate__(self):
+        return {'_loader': None, '_data': self.data, 'dirty': True}
+
+
+# attribute columns
+
+def _encode(values):
+    """Arrays for the values of a cache, and the name of their encoding"""
+    if isinstance(values, LazyColumn):
+        values = values.data
+    if isinstance(values, ModelTable):
+        return 'table', dict(keys=np.array(list(values.index)), coef=values.coef, intercept=values.intercept,
+                             alpha=values.alpha, null=values.null, degree=values.degree, lists=values.lists)
+    if len(values) == 0:
+        return 'empty', {}
+
+    keys = list(values.keys())
+    items = list(values.values())
+    if not (all(isinstance(k, (int, np.integer)) for k in keys) or all(isinstance(k, str) for k in keys)):
+        return None, None
+    keys = np.array(keys)
+
+    if all(v is None or isinstance(v, (bool, int, float, np.number)) for v in items):
+        none = np.array([v is None for v in items])
+        column = np.array([np.nan if v is None else v for v in items])
+        return 'numeric', dict(keys=keys, values=column, none=none)
+
+    if all(isinstance(v, list) for v in items) and len({len(v) for v in items}) == 1 \
+            and all(isinstance(e, (int, float, np.number)) for v in items for e in v):
+        return 'vectors', dict(keys=keys, values=np.array(items, dtype=float).reshape(len(items), -1))
+
+    return None, None
+
+
+def _decode(encoding, arrays):
+    if encoding == 'empty':
+        return {}
+    keys = arrays['keys'].tolist()
+    if encoding == 'table':
+        table = ModelTable(keys, arrays['coef'], arrays['intercept'], arrays['alpha'], arrays['null'],
+                           degree=int(arrays['degree']), lists=bool(arrays['lists']))
+        return table
+    if encoding == 'numeric':
+        values = arrays['values'].tolist()
+        return {k: None if none else v for k, v, none in zip(keys, values, arrays['none'].tolist())}
+    if encoding == 'vectors':
+        return dict(zip(keys, arrays['values'].tolist()))
+    raise ValueError(f'unknown attribute encoding {encoding}')
+
+
+def _column_file(path, scope, name, generation):
+    return Path(path) / 'attrs' / scope / f'{quote(name, safe="")}.{generation}'
+
+
+def save_column(path, scope, name, values, generation=0):
+    """Write an attribute's values. Returns the encoding and the file's name (relative to path)"""
+    file = _column_file(path, scope, name, generation)
+    file.parent.mkdir(parents=True, exist_ok=True)
+    encoding, arrays = _encode(values)
+    if encoding is None:
+        file = file.with_name(file.name + '.pkl')
+        _save_pickle(file, dict(values.data if isinstance(values, LazyColumn) else values))
+        encoding = 'pickle'
+    else:
+        file = file.with_name(file.name + '.npz')
+        _save_npz(file, **arrays)
+    return encoding, file.relative_to(path).as_posix()
+
+
+def load_column(path, encoding, file):
+    file = Path(path) / file
+    if encoding == 'pickle':
+        with open(file, 'rb') as f:
+            return pickle.load(f)
+    with np.load(file, allow_pickle=False) as arrays:
+        return _decode(encoding, arrays)
+
+
+def _spec(cache):
+    """A cache's definition, without its values or context"""
+    state = cache.__getstate__()
+    for name in ('cache', 'context', 'parent', 'dirty'):
+        state.pop(name, None)
+    return state
+
+
+def _restore(spec, context, values):
+    cache = Cache.__new__(Cache)
+    cache.__setstate__(dict(spec, cache=values, context=context, parent=None, dirty=False))
+    return cache
+
+
+def _clean(cache):
+    """The cache's values are those of its file: none were written since (through the cache or directly)"""
+    values = cache.cache
+    return isinstance(values, LazyColumn) and not values.dirty and not getattr(cache, 'dirty', True)
+
+
+def save_attrs(path, scope, has_attrs, previous=None, generation=0):
+    """Write the attributes of has_attrs and return their meta entries.
+
+    Attributes that have an entry in previous and were not changed since are not written again
+    """
+    previous = previous or {}
+    changed = has_attrs.__dict__.get('changed', set())
+    entries = {}
+    for name, value in has_attrs.attr.cache.items():
+        if isinstance(value, Cache):
+            if not value.save:
+                continue
+            old = previous.get(name, None)
+            if old is not None and old['kind'] == 'cache' and name not in changed and _clean(value):
+                entries[name] = dict(old, spec=_spec(value))
+                continue
+            values = value.cache
+            if not isinstance(values, LazyColumn) or values.loaded:
+                # the models are written as a table, but the cache keeps its own objects
+                values = tabulate(values.data if isinstance(values, LazyColumn) else values) or values
+            encoding, file = save_column(path, scope, name, values, generation)
+            entries[name] = dict(kind='cache', spec=_spec(value), encoding=encoding, file=file)
+            value.cache = LazyColumn(data=value.cache.data if isinstance(value.cache, LazyColumn) else value.cache)
+            value.dirty = False
+        else:
+            entries[name] = dict(kind='value', value=value)
+    return entries
+
+
+def load_attrs(path, has_attrs, entries, dependencies):
+    for name, entry in entries.items():
+        if entry['kind'] == 'value':
+            has_attrs.attr.cache[name] = entry['value']
+        else:
+            loader = (lambda e=entry: load_column(path, e['encoding'], e['file']))
+            has_attrs.attr.cache[name] = _restore(entry['spec'], has_attrs.attr, LazyColumn(loader))
+    has_attrs.dependencies = defaultdict(list, dependencies)
+
+
+# the tree
+
+def tree_arrays(regulus):
+    arrays = TreeArrays(regulus.tree.root)
+    data = [node.data for node in arrays.nodes]
+    extrema = [list(p.extrema) for p in data]
+    return dict(ids=arrays.ids, parent=arrays.parent, span=arrays.span, minmax=arrays.minmax,
+                persistence=arrays.persistence,
+                extrema_offsets=np.r_[0, np.cumsum([len(e) for e in extrema])].astype(int),
+                extrema=np.array([i for e in extrema for i in e], dtype=int),
+                max_merge=np.array([bool(p.max_merge) for p in data]),
+                base=np.array([-1 if p.base is None else p.base for p in data], dtype=int),
+                offset=np.array([getattr(node, 'offset', 0) for node in arrays.nodes], dtype=int))
+
+
+def build_tree(regulus, arrays):
+    nodes = []
+    extrema, offsets = arrays['extrema'].tolist(), arrays['extrema_offsets'].tolist()
+    for i, (id_, parent) in enumerate(zip(arrays['ids'].tolist(), arrays['parent'].tolist())):
+        base = int(arrays['base'][i])
+        partition = Partition(id_, float(arrays['persistence'][i]),
+                              pts_span=tuple(arrays['span'][i].tolist()),
+                              minmax_idx=arrays['minmax'][i].tolist(),
+                              extrema=extrema[offsets[i]:offsets[i+1]],
+                              max_merge=bool(arrays['max_merge'][i]),
+                              base=None if base < 0 else base,
+                              regulus=regulus)
+        nodes.append(Node(ref=id_, data=partition, parent=nodes[parent] if parent >= 0 else None,
+                          offset=int(arrays['offset'][i])))
+    return nodes[0] if nodes else None
+
+
+# the whole regulus
+
+def _meta(regulus):
+    pts = regulus.pts
+    return dict(format=FORMAT, version=VERSION, generation=0, type=regulus.type, measure=regulus.measure,
+                x_columns=list(pts.x.columns), value_columns=list(pts.values.columns), scaler=pts.scaler,
+                groups=getattr(pts, 'groups', None) is not None, files={}, digests={}, tree=None, attrs={}, dependencies={})
+
+
+def _read_meta(path):
+    with open(Path(path) / 'meta.pkl', 'rb') as f:
+        meta = pickle.load(f)
+    if meta.get('format') != FORMAT:
+        raise ValueError(f'{path} is not a columnar regulus file')
+    # files written before incremental saves
+    meta.setdefault('generation', 0)
+    meta.setdefault('tree', dict(file='tree.npz', digest=None))
+    meta.setdefault('files', _data_files(0, meta.get('groups', False)))
+    meta.setdefault('digests', {})
+    return meta
+
+
+def _data_files(generation, groups):
+    """The files of the points of a full save of the given generation"""
+    names = ('x', 'values', 'pts_loc', 'groups') if groups else ('x', 'values', 'pts_loc')
+    return {name: f'{name}.npy' if generation == 0 else f'{name}.{generation}.npy' for name in names}
+
+
+def _data_arrays(regulus, groups):
+    pts = regulus.pts
+    arrays = dict(x=np.ascontiguousarray(pts.x.values), values=np.ascontiguousarray(pts.values.values),
+                  pts_loc=np.asarray(regulus.pts_loc, dtype=int))
+    if groups:
+        arrays['groups'] = pts.groups.inverse
+    return arrays
+
+
+def _mapped(array, file):
+    """array is the whole of a read only memory map of file, i.e. it is the file's content"""
+    base = array
+    while isinstance(base, np.ndarray):
+        if isinstance(base, np.memmap):
+            return base.mode == 'r' and base.filename is not None \
+                and Path(base.filename).resolve() == Path(file).resolve() \
+                and base.shape == array.shape and base.strides == array.strides and base.ctypes.data == array.ctypes.data
+        base = base.base
+    return False
+
+
+def _digest(arrays):
+    h = hashlib.sha1()
+    for name in sorted(arrays):
+        h.update(name.encode())
+        h.update(np.ascontiguousarray(arrays[name]).tobytes())
+    return h.hexdigest()
+
+
+def save(regulus, path, incremental=True):
+    """Save regulus in the columnar format. path is a directory.
+
+    If regulus was loaded from (or last saved to) path, only what changed since is written
+    """
+    path = Path(path)
+    existing = _read_meta(path) if is_columnar(path) else None
+    previous = None
+    if incremental and existing is not None and regulus.filename is not None \
+            and Path(regulus.filename).resolve() == path.resolve():
+        previous = existing
+    path.mkdir(parents=True, exist_ok=True)
+
+    meta = _meta(regulus)
+    generation = meta['generation'] = existing['generation'] + 1 if existing else 0
+    # a full save writes the points to files of its generation. The files of the existing save, if any, stay in
+    # place until meta.pkl is replaced. An incremental save writes only the arrays that changed
+    files = meta['files'] = dict(previous['files']) if previous is not None else {}
+    digests = meta['digests'] = dict(previous['digests']) if previous is not None else {}
+    new = _data_files(generation, meta['groups'])
+    for name, array in _data_arrays(regulus, meta['groups']).items():
+        if name in files and _mapped(array, path / files[name]):
+            continue
+        digest = _digest({name: array})
+        if name not in files or digests.get(name, None) != digest:
+            files[name] = new[name]
+            _save_npy(path / files[name], array)
+        digests[name] = digest
+    for name in set(files) - set(new):
+        del files[name]
+        digests.pop(name, None)
+
+    tree = tree_arrays(regulus)
+    digest = _digest(tree)
+    if previous is not None and previous['tree'] is not None and previous['tree']['digest'] == digest:
+        meta['tree'] = previous['tree']
+    else:
+        file = f'tree.{generation}.npz'
+        _save_npz(path / file, **tree)
+        meta['tree'] = dict(file=file, digest=digest)
+
+    for scope, has_attrs in (('regulus', regulus), ('tree', regulus.tree)):
+        old = previous['attrs'].get(scope, {}) if previous else None
+        meta['attrs'][scope] = save_attrs(path, scope, has_attrs, old, generation)
+        meta['dependencies'][scope] = dict(has_attrs.dependencies)
+    _save_pickle(path / 'meta.pkl', meta)
+
+    for has_attrs in (regulus, regulus.tree):
+        has_attrs.changed = set()
+    return meta
+
+
+def _referenced(meta):
+    files = {'meta.pkl', meta['tree']['file'], *meta['files'].values()}
+    files.update(entry['file'] for entries in meta['attrs'].values() for entry in entries.values() if 'file' in entry)
+    return files
+
+
+def compact(path):
+    """Remove the files of older generations, and leftovers of interrupted saves. Returns the removed files"""
+    path = Path(path)
+    keep = _referenced(_read_meta(path))
+    removed = []
+    for file in sorted(path.rglob('*')):
+        if file.is_file() and file.relative_to(path).as_posix() not in keep:
+            file.unlink()
+            removed.append(file)
+    return removed
+
+
+def load(path, mmap=True):
+    """Load a Regulus saved in the columnar format. The points are memory mapped unless mmap is False"""
+    path = Path(path)
+    meta = _read_meta(path)
+
+    mode = 'r' if mmap else None
+    files = meta['files']
+    x = pd.DataFrame(np.load(path / files['x'], mmap_mode=mode), columns=meta['x_columns'], copy=False)
+    values = pd.DataFrame(np.load(path / files['values'], mmap_mode=mode), columns=meta['value_columns'], copy=False)
+    pts = Data(x, values)
+    pts.scaler = meta['scaler']
+    if meta.get('groups', False):
+        pts.groups = Groups(np.load(path / files['groups']))
+
+    regulus = Regulus(pts, np.load(path / files['pts_loc']).tolist(), meta['measure'], type=meta['type'])
+    for scope, has_attrs in (('regulus', regulus), ('tree', regulus.tree)):
+        load_attrs(path, has_attrs, meta['attrs'].get(scope, {}), meta['dependencies'].get(scope, {}))
+    with np.load(path / meta['tree']['file']) as arrays:
+        regulus.tree.root = build_tree(regulus, arrays)
+    for has_attrs in (regulus, regulus.tree):
+        has_attrs.changed = set()
+    regulus.filename = path
+    return regulus
+
+
+def convert(src, dst=None):
+    """Convert a pickled .regulus file to the columnar format. By default dst is src's name with a .rgl suffix"""
+    with open(src, 'rb') as f:
+        regulus = pickle.load(f)
+    if not isinstance(regulus, Regulus):
+        raise ValueError(f'{src} is not a regulus file')
+    dst = Path(dst) if dst is not None else Path(src).with_suffix('.rgl')
+    save(regulus, dst)
+    return dst
@@ -1,12 +1,12 @@
-from time import process_time
+from time import perf_counter
 
 
 def timed(method):
     def _timed(*args, **kwargs):
-        start = process_time()
+        start = perf_counter()
         value = method(*args, **kwargs)
-        end = process_time()
+        end = perf_counter()
 
-        print(f'{end-start:.2f}ms')
+        print(f'{end-start:.2f}s')
         return value
     return _timed
@@ -45,7 +45,8 @@ setup(
     tests_require=['nose'],
     entry_points={
         'console_scripts': [
-            'regulus=regulus.command_line:main'
+            'regulus=regulus.command_line:main',
+            'regulus-sweep=regulus.command_line:sweep'
         ],
     }
 )
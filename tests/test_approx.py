@@ -0,0 +1,57 @@
+"""Agreement of the approximate (subsample) msc with the exact one"""
+from functools import lru_cache
+from pathlib import Path
+import numpy as np
+
+from regulus.core.data import Data
+from regulus.topo import msc
+from regulus.topo.approx import agreement, subsample
+
+FILENAME = Path(__file__).with_name('gauss4.csv')
+KNN = 8
+
+
+@lru_cache()
+def _data():
+    data = Data.read_csv(FILENAME)
+    data.normalize()
+    return data
+
+
+@lru_cache()
+def _exact():
+    return msc(_data(), knn=KNN)
+
+
+def test_subsample():
+    x = np.random.default_rng(0).uniform(size=(100, 2))
+    assert len(subsample(x, 0.25)) == 25
+    assert len(subsample(x, 10, 'farthest', seed=0)) == 10
+    assert len(subsample(x, 1.0)) == 100
+    assert list(subsample(x, [5, 1, 5])) == [1, 5]
+
+
+def test_covers_all_points():
+    approx = msc(_data(), knn=KNN, sample=0.25, seed=0)
+    assert sorted(approx.pts_loc) == list(range(len(_data().x)))
+    assert approx.tree.root.data.pts_span[1] == len(_data().x)
+
+
+def test_agreement():
+    for sampling in ('random', 'farthest'):
+        report = agreement(msc(_data(), knn=KNN, sample=0.5, sampling=sampling, seed=0), _exact())
+        assert report['partitions'] <= report['exact_partitions']
+        assert report['ari_0.1'] > 0.7, (sampling, report)
+
+
+def test_full_sample():
+    full = msc(_data(), knn=KNN, sample=len(_data().x))
+    report = agreement(full, _exact())
+    assert report['partitions'] == report['exact_partitions']
+    assert report['ari_0'] == 1
+
+
+if __name__ == '__main__':
+    for test in (test_subsample, test_covers_all_points, test_agreement, test_full_sample):
+        test()
+        print(test.__name__, 'ok')
@@ -0,0 +1,65 @@
+"""The regulus command line over several csv files: outputs, summaries and skipping the up to date ones"""
+import csv
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+from regulus.command_line import main
+from regulus.utils import io
+
+FILENAME = Path(__file__).with_name('gauss4.csv')
+
+
+def _run(monkeypatch, *args):
+    monkeypatch.setattr(sys, 'argv', ['regulus', *map(str, args)])
+    main()
+
+
+def _rows(summary):
+    with open(summary) as f:
+        return list(csv.DictReader(f))
+
+
+def _statuses(summary):
+    return {Path(row['file']).name: row['status'] for row in _rows(summary)}
+
+
+def test_batch(tmp_path, monkeypatch):
+    data, out, summary = tmp_path / 'data', tmp_path / 'out', tmp_path / 'summary.csv'
+    data.mkdir()
+    shutil.copy(FILENAME, data / 'a.csv')
+    shutil.copy(FILENAME, data / 'b.csv')
+
+    _run(monkeypatch, data, '--out', out, '--attrs', 'fitness', '--summary', summary)
+    assert _statuses(summary) == {'a.csv': 'done', 'b.csv': 'done'}
+    regulus = io.load(out / 'a.regulus')
+    assert len(regulus.attr['fitness'].cache) == len(list(regulus.tree))
+
+    _run(monkeypatch, data, '--out', out, '--attrs', 'fitness', '--summary', summary)
+    assert _statuses(summary) == {'a.csv': 'skipped', 'b.csv': 'skipped'}
+
+    with open(data / 'b.csv', 'a') as f:
+        f.write('0.5,0.5,0.5\n')
+    _run(monkeypatch, data, '--out', out, '--attrs', 'fitness', '--summary', summary)
+    assert _statuses(summary) == {'a.csv': 'skipped', 'b.csv': 'done'}
+
+    _run(monkeypatch, data, '--out', out, '--attrs', 'fitness', '--knn', 16, '--summary', summary)
+    assert _statuses(summary) == {'a.csv': 'done', 'b.csv': 'done'}
+
+
+def test_same_output(tmp_path, monkeypatch):
+    data, out, summary = tmp_path / 'data', tmp_path / 'out', tmp_path / 'summary.csv'
+    (data / 'sub').mkdir(parents=True)
+    shutil.copy(FILENAME, data / 'a.csv')
+    shutil.copy(FILENAME, data / 'sub' / 'a.csv')
+
+    with pytest.raises(SystemExit):
+        _run(monkeypatch, data, '--out', out, '--summary', summary)
+    rows = _rows(summary)
+    assert [row['status'] for row in rows] == ['done', 'failed']
+    assert 'same output' in rows[1]['error']
+    # the files were built in one process: its peak memory isn't that of a single file
+    assert rows[0]['memory'] == ''
+    assert (out / 'a.regulus').exists()
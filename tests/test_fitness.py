@@ -0,0 +1,131 @@
+"""Closed-form fitness measures against sklearn's scores, per node of gauss4"""
+import pickle
+from pathlib import Path
+
+import numpy as np
+import pytest
+from sklearn.linear_model import LinearRegression, Ridge
+from sklearn.metrics import r2_score
+
+from regulus.measures import linear
+from regulus.models import moments
+from regulus.models.quadratic_model import quadratic_model
+from regulus.topo.regulus import Partition
+from regulus.utils import io
+
+FILENAME = Path(__file__).with_name('gauss4.csv')
+
+
+def _regulus():
+    return io.from_csv(FILENAME)
+
+
+def _nodes(regulus):
+    return [node for node in regulus.tree if node.id >= 0 and node.parent.id != -1 and len(node.data.x) >= 2]
+
+
+def _sklearn(has_model, has_pts):
+    """R^2 on has_pts of the default model (ridge_model) of has_model"""
+    model = Ridge(alpha=1.0).fit(has_model.data.x.values, has_model.data.y.values)
+    return r2_score(has_pts.data.y.values, model.predict(has_pts.data.x.values))
+
+
+def test_fitness():
+    regulus = _regulus()
+    for node in _nodes(regulus):
+        assert np.isclose(regulus.tree.attr['fitness'][node], _sklearn(node, node))
+
+
+def test_stepwise_fitness():
+    regulus = _regulus()
+    for node in _nodes(regulus):
+        x, y = node.data.x.values, node.data.y.values
+        dims = np.argsort(np.fabs(regulus.attr['model'][node].coef_))
+        steps = regulus.attr['stepwise_fitness'][node]
+        assert [dim for dim, _ in steps] == dims.tolist()
+        for i, (_, score) in enumerate(steps):
+            subspace = x[:, dims[:i + 1]]
+            assert np.isclose(score, LinearRegression().fit(subspace, y).score(subspace, y))
+
+
+def test_derived_statistics():
+    regulus = _regulus()
+    for node in regulus.tree:
+        regulus.tree.attr['fitness'][node]
+    assert regulus.moments is not None
+    assert '_moments' not in pickle.loads(pickle.dumps(regulus)).__dict__
+
+    regulus.tree.root = regulus.tree.root
+    assert regulus.__dict__['_moments'] is None
+    regulus.moments
+    regulus.pts = regulus.pts
+    assert regulus.__dict__['_moments'] is None
+
+
+def test_moments_of_other_partitions(monkeypatch):
+    regulus = _regulus()
+    partition = Partition(-1, 0, pts_span=(0, 30), regulus=regulus)
+    n, mean, _ = regulus.moments.of(partition)
+    assert n == 30 and np.allclose(mean[:-1], partition.x.values.mean(axis=0))
+
+    monkeypatch.setattr(moments, 'scatter', lambda *args: pytest.fail('the statistics were computed again'))
+    assert linear._size(partition) == 30
+    regulus.moments.fit_partition(partition, alpha=1.0)
+
+
+def test_quadratic():
+    regulus = _regulus()
+    for node in _nodes(regulus):
+        if len(node.data.x) < 20:
+            continue
+        x, y = node.data.x, node.data.y
+        expected = quadratic_model(regulus.attr, node)
+        assert np.allclose(regulus.attr['quadratic'][node].predict(x.values), expected.predict(x))
+        assert np.isclose(regulus.attr['q_fitness'][node], expected.score(x, y))
+
+
+def test_quadratic_without_scatter():
+    regulus = _regulus()
+    kept = regulus.design_moments(degree=2)
+    dropped = moments.Moments.from_regulus(regulus, degree=2, keep=False)
+    assert dropped.scatter is None
+    for a, b in zip(kept.fit(), dropped.fit()):
+        assert np.allclose(a, b)
+
+
+def test_relative_fitness():
+    regulus = _regulus()
+    for node in _nodes(regulus):
+        assert np.isclose(regulus.tree.attr['parent_fitness'][node], _sklearn(node.parent, node))
+        assert np.isclose(regulus.tree.attr['child_fitness'][node], _sklearn(node, node.parent))
+
+
+def test_relative_fitness_mixed_models(monkeypatch):
+    regulus = _regulus()
+    nodes = _nodes(regulus)
+    odd = nodes[len(nodes) // 2]
+    regulus.tree.attr['model'][odd] = quadratic_model(regulus.tree.attr, odd)
+
+    scans = []
+    edge_fitness = linear.edge_fitness
+    monkeypatch.setattr(linear, 'edge_fitness', lambda *args: scans.append(1) or edge_fitness(*args))
+    for node in nodes:
+        expected = linear.relative_fitness(regulus.tree.attr, node.parent, node)
+        assert np.isclose(regulus.tree.attr['parent_fitness'][node], expected)
+        regulus.tree.attr['child_fitness'][node]
+    assert len(scans) == 1
+
+
+def test_assigned_model():
+    regulus = _regulus()
+    nodes = _nodes(regulus)
+    for node in nodes:
+        regulus.attr['fitness'][node]
+    regulus.predictions('model')
+
+    node = nodes[len(nodes) // 2]
+    x, y = node.data.x.values, node.data.y.values
+    model = LinearRegression().fit(x, -10 * y)
+    regulus.attr['model'][node] = model
+    assert np.isclose(regulus.attr['fitness'][node], model.score(x, y))
+    assert np.isclose(regulus.predictions('model').score(node.data), model.score(x, y))
@@ -0,0 +1,92 @@
+"""Neighborhood graphs: the graph cache and the kNN backend"""
+from functools import lru_cache
+from pathlib import Path
+
+import pytest
+
+from regulus.core.data import Data
+from regulus.topo import msc, Graph, KnnGraph
+from regulus.topo.graph import CachedGraph, adjacency_of, ngl_graph
+
+FILENAME = Path(__file__).with_name('gauss4.csv')
+KNN = 8
+
+
+@lru_cache()
+def _data():
+    data = Data.read_csv(FILENAME)
+    data.normalize()
+    return data
+
+
+def _partitions(regulus):
+    return len([node for node in regulus.tree if node.id >= 0])
+
+
+def _tree(regulus):
+    return [(node.id, tuple(node.data.pts_span)) for node in regulus.tree]
+
+
+def _adjacency(graph, knn, beta=1):
+    g = ngl_graph(graph, knn, beta)
+    g.build(_data().x.values)
+    return adjacency_of(g, len(_data().x))
+
+
+def test_cache_hit(tmp_path):
+    exact = msc(_data(), knn=KNN)
+    first = msc(_data(), knn=KNN, cache=tmp_path)
+    assert len(list(tmp_path.glob('*.npz'))) == 1
+    second = msc(_data(), knn=KNN, cache=tmp_path)
+    assert len(list(tmp_path.glob('*.npz'))) == 1
+    assert _tree(exact) == _tree(first) == _tree(second)
+
+
+def test_cache_flags_hit(tmp_path):
+    x = _data().x.values
+    for hit in (False, True):
+        graph = CachedGraph(ngl_graph('relaxed beta skeleton', KNN, 1), tmp_path, knn=KNN)
+        graph.build(x)
+        assert graph.hit == hit
+
+
+def test_cache_adjacencies(tmp_path):
+    a, b = _adjacency('relaxed beta skeleton', KNN), _adjacency('beta skeleton', 32, 2)
+    for adjacency in (a, b):
+        cached = msc(_data(), knn=KNN, graph=adjacency, cache=tmp_path)
+        assert _tree(cached) == _tree(msc(_data(), knn=KNN, graph=adjacency))
+    assert len(list(tmp_path.glob('*.npz'))) == 2
+
+    cached = msc(_data(), knn=KNN, graph=Graph(b), cache=tmp_path)
+    assert _tree(cached) == _tree(msc(_data(), knn=KNN, graph=b))
+    assert len(list(tmp_path.glob('*.npz'))) == 3
+
+
+def test_cache_parameters(tmp_path):
+    msc(_data(), knn=KNN, cache=tmp_path)
+    msc(_data(), knn=2 * KNN, cache=tmp_path)
+    msc(_data(), knn=KNN, beta=1.5, cache=tmp_path)
+    assert len(list(tmp_path.glob('*.npz'))) == 3
+
+
+def test_connect():
+    with pytest.raises(ValueError, match='connect'):
+        msc(_data(), knn=KNN, connect=True)
+
+
+def test_knn_graph():
+    x = _data().x.values
+    baseline = _adjacency('beta skeleton', 32) > 0
+    for backend in ('kdtree', 'sklearn'):
+        graph = KnnGraph(32, 1, backend=backend)
+        graph.build(x)
+        adjacency = graph.adjacency > 0
+        assert (adjacency != adjacency.T).nnz == 0
+        assert (adjacency != baseline).nnz <= 1e-3 * baseline.nnz
+
+
+def test_knn_graph_msc():
+    x = _data().x.values
+    graph = KnnGraph(32, 1)
+    graph.build(x)
+    assert _tree(msc(_data(), knn=32, graph=graph)) == _tree(msc(_data(), knn=32, graph='beta skeleton'))
@@ -0,0 +1,44 @@
+"""Aggregation of duplicate points"""
+import numpy as np
+import pandas as pd
+
+from regulus.core.data import Data
+from regulus.core.groups import Groups
+
+
+def _data(seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(size=(50, 3))[rng.integers(0, 50, 200)]
+    return Data(pd.DataFrame(x, columns=['a', 'b', 'c']), pd.DataFrame(dict(y=rng.normal(size=200))))
+
+
+def test_groups():
+    data = _data()
+    groups = Groups.of(data.x.values)
+    x = data.x.values
+    assert (x == x[groups.first][groups.inverse]).all()
+    assert len(groups) == len(np.unique(x, axis=0))
+    assert list(groups.first) == sorted(groups.first)
+
+
+def test_expand():
+    groups = Groups.of(_data().x.values)
+    rows = groups.expand([2, 0])
+    assert list(rows) == list(np.flatnonzero(groups.inverse == 2)) + list(np.flatnonzero(groups.inverse == 0))
+
+
+def test_aggregate():
+    data = _data()
+    for reducer in ('mean', 'max', 'first', np.ptp):
+        aggregated = data.aggregate(reducer)
+        expected = data.values.groupby(aggregated.groups.inverse)['y'].agg(reducer).values
+        assert np.allclose(aggregated.values['y'].values, expected)
+        assert aggregated.raw is data
+    unique = Data(pd.DataFrame(np.eye(3)), pd.DataFrame(dict(y=[1., 2., 3.])))
+    assert unique.aggregate() is unique
+
+
+if __name__ == '__main__':
+    for test in (test_groups, test_expand, test_aggregate):
+        test()
+        print(test.__name__, 'ok')
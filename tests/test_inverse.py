@@ -0,0 +1,93 @@
+"""Inverse regression curves and inv_fitness on gauss4"""
+import pickle
+from pathlib import Path
+
+import numpy as np
+
+from regulus.models.inv_reg import binned_lowess, gaussian, inverse_lowess_std, sample_lowess, window_lowess
+from regulus.utils import io
+
+FILENAME = Path(__file__).with_name('gauss4.csv')
+
+
+def _regulus():
+    return io.from_csv(FILENAME)
+
+
+def _lowess(S, X, Y, kernel):
+    """The local regressions of Y on X at S, one query point at a time"""
+    X = np.c_[np.ones(len(X)), X]
+    result = []
+    for s in S:
+        s = np.r_[1, s]
+        xw = X.T * kernel(s, X)
+        result.append(s @ np.linalg.pinv(xw @ X) @ xw @ Y)
+    return np.array(result)
+
+
+def _inverse(partition, grid, bandwidth_factor=0.2):
+    """A partition's inverse regression curve and std on the grid points in its range, one point at a time"""
+    x, y = partition.x.values, partition.y.values
+    s = grid[(grid >= y.min()) & (grid <= y.max())]
+    kernel = gaussian(bandwidth_factor * (partition.max() - partition.min()))
+    line = _lowess(s, y, x, kernel)
+    w = np.array([kernel(np.r_[1, v], np.c_[np.ones(len(y)), y]) for v in s])
+    std = np.sqrt(w @ (_lowess(y, y, x, kernel) - x) ** 2 / w.sum(axis=1)[:, None])
+    scaler = partition.regulus.scaler
+    return scaler.inverse_transform(line), std * scaler.scale_
+
+
+def test_inverse_curves():
+    regulus = _regulus()
+    curves = regulus.inverse_curves(bandwidth_factor=0.2)
+    nodes = [node for node in regulus.tree if node.id >= 0 and len(node.data.y) >= 10]
+    for node in nodes[::len(nodes) // 8]:
+        curve, std = curves.frames(node.data)
+        line, expected = _inverse(node.data, curves.grid)
+        assert np.allclose(curve.values, line) and np.allclose(std.values, expected)
+        assert regulus.attr['inverse_regression'][node][0].equals(curve)
+
+
+def _sample(n=2000):
+    rng = np.random.default_rng(0)
+    x = rng.random(n)
+    y = np.c_[np.sin(2 * np.pi * x), x * x] + 0.05 * rng.standard_normal((n, 2))
+    return np.linspace(0, 1, 500), x, y
+
+
+def test_window_lowess():
+    s, x, y = _sample()
+    for sigma, bound in ((0.02, 1e-4), (0.05, 1e-4), (0.2, 1e-12)):
+        kernel = gaussian(sigma)
+        assert np.abs(window_lowess(s, x, y, kernel) - sample_lowess(s, x, y, kernel)).max() < bound
+
+
+def test_binned_lowess():
+    s, x, y = _sample()
+    for sigma in (0.02, 0.05, 0.2):
+        kernel = gaussian(sigma)
+        assert np.abs(binned_lowess(s, x, y, kernel) - sample_lowess(s, x, y, kernel)).max() < 1e-3
+
+
+def test_approximate_std():
+    _, y, x = _sample()
+    kernel = gaussian(0.05)
+    exact = inverse_lowess_std(x, y, kernel=kernel)
+    for method in ('window', 'binned'):
+        assert np.allclose(inverse_lowess_std(x, y, kernel=kernel, method=method), exact, rtol=1e-2)
+
+
+def test_reload_uses_cached_curves():
+    regulus = _regulus()
+    expected = [regulus.attr['inv_fitness'][node] for node in regulus.tree]
+
+    loaded = pickle.loads(pickle.dumps(regulus))
+    assert [loaded.attr['inv_fitness'][node] for node in loaded.tree] == expected
+    assert not loaded.__dict__.get('_inverse_curves', None)
+
+    # without cached curves, all the edges are computed from the shared curves
+    loaded.clear_attr('inverse_regression')
+    loaded.clear_attr('inv_fitness')
+    values = [loaded.attr['inv_fitness'][node] for node in loaded.tree]
+    assert np.allclose(np.array(values, dtype=float), np.array(expected, dtype=float), equal_nan=True)
+    assert loaded.__dict__['_inverse_curves']
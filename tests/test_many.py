@@ -0,0 +1,45 @@
+"""Complexes built together (msc_many, sweep) against separate msc calls"""
+from functools import lru_cache
+from pathlib import Path
+
+import pandas as pd
+
+from regulus.core.data import Data
+from regulus.topo import msc
+from regulus.topo.morse import msc_many
+from regulus.topo.sweep import sweep
+
+FILENAME = Path(__file__).with_name('gauss4.csv')
+KNN = 8
+
+
+@lru_cache()
+def _data():
+    data = Data.read_csv(FILENAME)
+    data.normalize()
+    y = data.values['y']
+    return Data(data.x, pd.DataFrame(dict(y=y, z=y * data.x['x1'] - y)))
+
+
+def _tree(regulus):
+    return list(regulus.pts_loc), [(node.id, tuple(node.data.pts_span)) for node in regulus.tree]
+
+
+def test_msc_many():
+    data = _data()
+    for processes in (1, 2):
+        reguli = msc_many(data, processes=processes, knn=KNN)
+        assert list(reguli) == ['y', 'z']
+        for measure, regulus in reguli.items():
+            assert regulus.pts is data
+            assert _tree(regulus) == _tree(msc(data, measure=measure, knn=KNN))
+
+
+def test_sweep():
+    data = _data()
+    table = sweep(data, knn=(8, 16), beta=(1, 1.5), measure='z', processes=1, keep=True)
+    assert list(zip(table.knn, table.beta)) == [(8, 1), (8, 1.5), (16, 1), (16, 1.5)]
+    for _, row in table.iterrows():
+        regulus = msc(data, measure='z', knn=row.knn, beta=row.beta)
+        assert _tree(row.regulus) == _tree(regulus)
+        assert row.partitions == len([node for node in regulus.tree if node.id >= 0])
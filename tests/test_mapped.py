@@ -0,0 +1,38 @@
+"""Memory mapped Data and its streaming normalization against the in-memory Data"""
+import numpy as np
+import pytest
+
+from regulus.core.data import Data
+
+
+@pytest.fixture
+def files(tmp_path):
+    rng = np.random.default_rng(0)
+    x = rng.normal(3, 2, (1000, 3))
+    np.save(tmp_path / 'x.npy', x)
+    np.save(tmp_path / 'values.npy', rng.random((1000, 1)))
+    return tmp_path / 'x.npy', tmp_path / 'values.npy'
+
+
+def test_from_npy(files):
+    mapped = Data.from_npy(*files, x_columns=['a', 'b', 'c'], value_columns=['y'])
+    data = Data.from_npy(*files, x_columns=['a', 'b', 'c'], value_columns=['y'], mmap=False)
+    assert mapped.mapped and not data.mapped
+    assert list(mapped.x.columns) == ['a', 'b', 'c'] and list(mapped.values.columns) == ['y']
+    assert np.array_equal(mapped.x.values, data.x.values) and np.array_equal(mapped.values.values, data.values.values)
+
+
+def test_streaming_normalize(files):
+    mapped = Data.from_npy(*files)
+    data = Data.from_npy(*files, mmap=False)
+    mapped.normalize(chunk=100)
+    data.normalize()
+
+    assert mapped.path == files[0].with_name('x.normalized.npy')
+    assert np.allclose(mapped.x.values, data.x.values)
+    assert np.allclose(mapped.scaler.mean_, data.scaler.mean_) and np.allclose(mapped.scaler.scale_, data.scaler.scale_)
+    # the original file is left as it was
+    assert np.allclose(np.load(files[0]).mean(axis=0), mapped.scaler.mean_)
+
+    rows = mapped.x.iloc[10:20]
+    assert np.allclose(mapped.inverse(rows).values, data.inverse(data.x.iloc[10:20]).values)
@@ -0,0 +1,53 @@
+"""Dense model tables: which models compact() converts, and that the conversions predict the same"""
+from pathlib import Path
+
+import numpy as np
+from sklearn import linear_model as lm
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import PolynomialFeatures
+
+from regulus.models.linear_fit import LinearFit
+from regulus.models.model_table import compact
+
+
+def _xy():
+    rng = np.random.default_rng(0)
+    x = rng.uniform(size=(100, 3))
+    return x, np.exp(x.sum(axis=1))
+
+
+def test_compact_linear():
+    x, y = _xy()
+    for model in (lm.LinearRegression(), lm.Ridge(alpha=0.5), lm.Lasso(alpha=0.01), lm.HuberRegressor(),
+                  make_pipeline(PolynomialFeatures(2), lm.LinearRegression())):
+        model.fit(x, y)
+        fit = compact(model)
+        assert isinstance(fit, LinearFit)
+        assert np.allclose(fit.predict(x), model.predict(x))
+
+
+def test_compact_glm():
+    x, y = _xy()
+    for model in (lm.PoissonRegressor(), lm.GammaRegressor(), lm.TweedieRegressor(power=1.5),
+                  make_pipeline(PolynomialFeatures(2), lm.PoissonRegressor())):
+        model.fit(x, y)
+        assert compact(model) is None
+
+
+def test_save_keeps_models(tmp_path):
+    from regulus.utils import io
+    regulus = io.from_csv(Path(__file__).with_name('gauss4.csv'))
+    regulus.tree.add_attr(lambda context, node: lm.LinearRegression().fit(node.data.x.values, node.data.y.values),
+                          name='sklearn_model')
+    models = regulus.tree.attr['sklearn_model']
+    for node in regulus.tree:
+        models[node]
+
+    io.save(regulus, tmp_path / 'gauss4.regulus')
+    assert type(models.cache) is dict
+    assert all(isinstance(m, lm.LinearRegression) for m in models.cache.values())
+
+    loaded = io.load(tmp_path / 'gauss4.regulus').tree.attr['sklearn_model']
+    x = regulus.x.values
+    for node in regulus.tree:
+        assert np.allclose(loaded[node].predict(x), models[node].predict(x))
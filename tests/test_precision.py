@@ -0,0 +1,100 @@
+"""Accuracy of the float32 precision mode, compared with float64"""
+from functools import lru_cache
+from pathlib import Path
+import numpy as np
+
+from regulus.core.data import Data
+from regulus.topo import Regulus, msc
+from regulus.utils import io
+from regulus.utils.store import tree_arrays, build_tree
+
+FILENAME = Path(__file__).with_name('gauss4.csv')
+KNN = 8
+
+
+@lru_cache()
+def _base():
+    return io.from_csv(FILENAME, knn=KNN)
+
+
+def with_precision(regulus, precision):
+    """A copy of regulus over its data converted to precision. The tree is the same, so values can be compared"""
+    pts = Data(regulus.pts.x.copy(), regulus.pts.values.copy()).set_precision(precision)
+    pts.scaler = regulus.pts.scaler
+    other = Regulus(pts, list(regulus.pts_loc), regulus.measure, type=regulus.type)
+    other.tree.root = build_tree(other, tree_arrays(regulus))
+    io.add_defaults(other)
+    return other
+
+
+def _values(owner, name, nodes):
+    values = owner.attr[name]
+    return [values[node] for node in nodes]
+
+
+def _compare(name, tol, tree=False, rtol=0):
+    r64 = _base()
+    r32 = with_precision(r64, 'float32')
+    n64 = [node for node in r64.tree if node.id >= 0]
+    n32 = [node for node in r32.tree if node.id >= 0]
+    a = _values(r64.tree if tree else r64, name, n64)
+    b = _values(r32.tree if tree else r32, name, n32)
+    for u, v in zip(a, b):
+        if u is None or v is None:
+            assert u is v, name
+        else:
+            assert np.allclose(u, v, rtol=rtol, atol=tol), (name, u, v)
+
+
+def test_data():
+    r32 = io.from_csv(FILENAME, knn=KNN, precision='float32')
+    assert r32.pts.precision == 'float32'
+    assert r32.y.dtype == np.float32
+    r64 = _base()
+    assert np.allclose(r32.x.values, r64.x.values, atol=1e-5)
+
+
+def test_msc_keeps_data():
+    data = Data.read_csv(FILENAME)
+    data.normalize()
+    r32 = msc(data, knn=KNN, precision='float32')
+    assert r32.pts.precision == 'float32'
+    assert data.precision == 'float64'
+    assert data.values.dtypes.eq(np.float64).all()
+
+
+def test_models():
+    r32 = with_precision(_base(), 'float32')
+    assert r32.pts.precision == 'float32'
+    assert r32.moments.scatter.dtype == np.float64
+    r64 = _base()
+    for n64, n32 in zip(r64.tree, r32.tree):
+        if n64.id < 0 or r64.moments.of(n64.data)[0] < 10:
+            continue
+        c64, c32 = r64.attr['model'][n64].coef_, r32.attr['model'][n32].coef_
+        assert np.allclose(c64, c32, rtol=1e-3, atol=1e-3)
+
+
+def test_fitness():
+    _compare('fitness', 1e-4)
+    _compare('shared_fitness', 1e-4)
+    _compare('q_fitness', 1e-3)
+    _compare('dim_score', 1e-4)
+
+
+def test_relative_fitness():
+    # a model extrapolated to a small partition can have a large negative R^2, hence the relative tolerance
+    _compare('parent_fitness', 1e-4, tree=True, rtol=1e-3)
+    _compare('child_fitness', 1e-4, tree=True, rtol=1e-3)
+
+
+def test_node_measures():
+    _compare('size', 0, tree=True)
+    _compare('min', 1e-5)
+    _compare('max', 1e-5)
+
+
+if __name__ == '__main__':
+    for test in (test_data, test_msc_keeps_data, test_models, test_fitness, test_relative_fitness, test_node_measures):
+        test()
+        print(test.__name__, 'ok')
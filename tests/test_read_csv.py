@@ -0,0 +1,38 @@
+"""Data.read_csv: the columns it reads, and memory mapped files of the right size"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from regulus.core.data import Data
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(dict(id=[f'p{i}' for i in range(50)], x1=rng.random(50), x2=rng.random(50),
+                             label=['a'] * 50, y=rng.random(50)))
+
+
+def test_numeric_columns(tmp_path, frame):
+    frame.to_csv(tmp_path / 'data.csv', index=False)
+    with pytest.warns(UserWarning, match='id'):
+        data = Data.read_csv(tmp_path / 'data.csv')
+    assert list(data.x.columns) == ['x1', 'x2'] and list(data.values.columns) == ['y']
+    assert np.allclose(data.x.values, frame[['x1', 'x2']].values)
+
+
+def test_usecols(tmp_path, frame):
+    frame.to_csv(tmp_path / 'data.csv', index=False)
+    data = Data.read_csv(tmp_path / 'data.csv', ndims=1, usecols=[2, 4], dtype='float32')
+    assert list(data.x.columns) == ['x2'] and list(data.values.columns) == ['y']
+    assert data.precision == 'float32'
+
+
+def test_mapped_size(tmp_path, frame):
+    with open(tmp_path / 'data.csv', 'w') as f:
+        f.write(frame.to_csv(index=False) + '\n\n\n')
+    data = Data.read_csv(tmp_path / 'data.csv', usecols=['x1', 'x2', 'y'], path=tmp_path / 'data.npy')
+    assert data.x.shape == (50, 2)
+    stored = np.load(tmp_path / 'data.npy')
+    assert stored.shape == (50, 3)
+    assert np.allclose(stored, frame[['x1', 'x2', 'y']].values)
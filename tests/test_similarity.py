@@ -0,0 +1,45 @@
+"""Batched similarity measures against sklearn's cosine_similarity and scores, per node of gauss4"""
+from pathlib import Path
+
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+
+from regulus.utils import io
+
+FILENAME = Path(__file__).with_name('gauss4.csv')
+
+
+def _regulus():
+    return io.from_csv(FILENAME)
+
+
+def _nodes(regulus):
+    return [node for node in regulus.tree if node.id >= 0 and node.parent.id >= 0 and len(node.data.x) >= 2]
+
+
+def _cosine(a, b):
+    return cosine_similarity([a], [b])[0][0]
+
+
+def _dim_scores(models, partition):
+    return [m.score(partition.x[[d]], partition.y) for m, d in zip(models, partition.x.columns)]
+
+
+def test_coef():
+    regulus = _regulus()
+    attr = regulus.attr
+    for node in _nodes(regulus):
+        coef = attr['model'][node].coef_
+        assert np.isclose(attr['coef_change'][node], _cosine(coef, attr['model'][node.parent].coef_))
+        assert np.isclose(attr['coef_similarity'][node], _cosine(coef, attr['shared_model'][node].coef_))
+
+
+def test_dims():
+    regulus = _regulus()
+    attr = regulus.attr
+    for node in _nodes(regulus):
+        parent = node.parent
+        score = _dim_scores(attr['dim_model'][node], node.data)
+        assert np.allclose(attr['dim_score'][node], score)
+        assert np.isclose(attr['dim_parent'][node], _cosine(score, _dim_scores(attr['dim_model'][parent], node.data)))
+        assert np.isclose(attr['dim_child'][node], _cosine(score, _dim_scores(attr['dim_model'][node], parent.data)))
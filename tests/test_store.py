@@ -0,0 +1,122 @@
+"""The columnar (.rgl) format: round trips, incremental saves and full saves into an existing file"""
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from regulus.core.data import Data
+from regulus.utils import io, store
+
+FILENAME = Path(__file__).with_name('gauss4.csv')
+ATTRS = ('fitness', 'model', 'dim_score')
+
+
+def _regulus():
+    regulus = io.from_csv(FILENAME)
+    for name in ATTRS:
+        for node in regulus.tree:
+            regulus.attr[name][node]
+    return regulus
+
+
+def _same(a, b):
+    assert list(a.pts_loc) == list(b.pts_loc)
+    assert np.array_equal(a.x.values, b.x.values) and np.array_equal(a.values.values, b.values.values)
+    assert [(n.id, tuple(n.data.pts_span)) for n in a.tree] == [(n.id, tuple(n.data.pts_span)) for n in b.tree]
+    x = a.x.values[:10]
+    for na, nb in zip(a.tree, b.tree):
+        assert np.allclose(a.attr['fitness'][na], b.attr['fitness'][nb], equal_nan=True)
+        assert np.allclose(a.attr['dim_score'][na], b.attr['dim_score'][nb])
+        assert np.allclose(a.attr['model'][na].predict(x), b.attr['model'][nb].predict(x))
+
+
+def _files(path):
+    return {f.relative_to(path).as_posix(): f.stat().st_mtime_ns for f in path.rglob('*') if f.is_file()}
+
+
+def test_round_trip(tmp_path):
+    regulus = _regulus()
+    io.save(regulus, tmp_path / 'gauss4.rgl', format='columns')
+    loaded = io.load(tmp_path / 'gauss4.rgl')
+    _same(regulus, loaded)
+    assert store.compact(tmp_path / 'gauss4.rgl') == []
+    _same(regulus, io.load(tmp_path / 'gauss4'))
+
+
+def test_incremental(tmp_path):
+    path = tmp_path / 'gauss4.rgl'
+    io.save(_regulus(), path, format='columns')
+    loaded = io.load(path)
+    before = _files(path)
+
+    node = next(iter(loaded.tree))
+    loaded.attr['fitness'][node] = 0.5
+    io.save(loaded)
+    written = {name for name, mtime in _files(path).items() if before.get(name) != mtime}
+    assert written == {'meta.pkl', f'attrs/regulus/fitness.1.npz'}
+
+    again = io.load(path)
+    assert again.attr['fitness'][node] == 0.5
+    assert len(store.compact(path)) == 1
+
+
+def test_incremental_changes(tmp_path):
+    path = tmp_path / 'gauss4.rgl'
+    io.save(_regulus(), path, format='columns')
+    loaded = io.load(path)
+    io.save(loaded)
+    assert loaded.__dict__['changed'] == set()
+    before = _files(path)
+
+    loaded.clear_attr('dim_score')
+    loaded.update_attr(loaded.attr['fitness'].factory, 'fitness')
+    for node in loaded.tree:
+        loaded.attr['dim_score'][node]
+    io.save(loaded)
+    written = {name for name, mtime in _files(path).items() if before.get(name) != mtime}
+    assert written == {'meta.pkl', 'attrs/regulus/dim_score.2.npz', 'attrs/regulus/fitness.2.npz'}
+    _same(_regulus(), io.load(path))
+
+
+def test_incremental_points(tmp_path):
+    path = tmp_path / 'gauss4.rgl'
+    io.save(_regulus(), path, format='columns')
+    loaded = io.load(path)
+    before = _files(path)
+
+    x = loaded.x * 2
+    loaded.pts = Data(x, loaded.values.copy())
+    io.save(loaded)
+    written = {name for name, mtime in _files(path).items() if before.get(name) != mtime}
+    assert written == {'meta.pkl', 'x.1.npy'}
+
+    again = io.load(path)
+    assert np.array_equal(again.x.values, x.values)
+    assert np.array_equal(again.values.values, loaded.values.values)
+    assert list(again.pts_loc) == list(loaded.pts_loc)
+
+
+def test_full_save_is_atomic(tmp_path, monkeypatch):
+    path = tmp_path / 'gauss4.rgl'
+    regulus = _regulus()
+    io.save(regulus, path, format='columns')
+
+    other = io.from_csv(FILENAME, knn=16)
+    write = store._save_pickle
+
+    def fail(file, obj):
+        if Path(file).name == 'meta.pkl':
+            raise OSError('disk full')
+        write(file, obj)
+
+    monkeypatch.setattr(store, '_save_pickle', fail)
+    with pytest.raises(OSError):
+        store.save(other, path, incremental=False)
+    _same(regulus, io.load(path))
+
+    monkeypatch.setattr(store, '_save_pickle', write)
+    store.save(other, path, incremental=False)
+    loaded = io.load(path)
+    assert list(loaded.pts_loc) == list(other.pts_loc)
+    assert store.compact(path)
+    _same(loaded, io.load(path))
@@ -0,0 +1,36 @@
+"""Vectorized node attributes against their per-node definitions, on gauss4"""
+from pathlib import Path
+
+import numpy as np
+
+from regulus.utils import io
+
+FILENAME = Path(__file__).with_name('gauss4.csv')
+
+
+def _regulus():
+    return io.from_csv(FILENAME)
+
+
+def test_node_attributes():
+    regulus = _regulus()
+    attr = regulus.tree.attr
+    for node in regulus.tree:
+        partition = node.data
+        assert attr['size'][node] == partition.size()
+        assert np.isclose(attr['rel_size'][node], partition.size() / attr['data_size'])
+        span = node.parent.data.persistence - partition.persistence if node.parent is not None else 0
+        assert np.isclose(attr['span'][node], span)
+        assert attr['persistence'][node] == partition.persistence
+        assert attr['max'][node] == partition.max() and attr['min'][node] == partition.min()
+
+
+def test_vectorized_factory():
+    regulus = _regulus()
+    regulus.add_attr(lambda context, arrays: arrays.size * 2, name='double', vectorized=True)
+    calls = []
+    regulus.add_attr(lambda context, arrays: calls.append(1) or arrays.persistence, name='counted', vectorized=True)
+    for node in regulus.tree:
+        assert regulus.attr['double'][node] == 2 * node.data.size()
+        assert regulus.attr['counted'][node] == node.data.persistence
+    assert len(calls) == 1